@@ -5,30 +5,86 @@ Create a plot with all occurrences with the date on the x-axis and
 the hour of the day on the y-axis. The top x-axis represents the total
 number of occurrences that day.
 
-The script is meant to run in the background. It checks for a FileModifiedEvent for
-the file holding the metrics data.
+The script is meant to run in the background. It checks for modified, created, and moved
+events for the file holding the metrics data. A burst of events is coalesced into one
+plot that is created shortly after the last event.
 
 This is a generic script that reads from a YAML file with the following structure:
 
     watch_path: <folder that contains the file(s) to watch>
 
+    render_mode: <scatter | density | auto>  # optional, default is auto
+    density_threshold: <number of occurrences>  # optional, auto switches to density above this
+
+    views: [all, 30d, 90d, weekly]  # optional, each view is written to '<png stem>-<view>.png'
+    formats: [png, svg, html]  # optional, default is png
+
+    annotations:  # optional, only the annotations in the plotted date range are drawn
+        - {kind: treatment, start: <YYYY-MM-DD>, end: <YYYY-MM-DD>, label: <text>, end_label: <text>}
+        - {kind: marker, start: <YYYY-MM-DD>, label: <text>}
+
     data:
         <YYYY-MM-DD>: ['HH:MM', 'HH:MM', ...]
         <YYYY-MM-DD>: ['HH:MM', 'HH:MM', ...]
 
-The YAML file path shall be passed as an argument.
+Instead of the data section, the occurrences can be kept in an append-only binary store,
+configured with `store: <path relative to the YAML file>`. Appending to the store doesn't
+rewrite the file, and only the appended records are read by the next render. Use the
+import-yaml-data and export-yaml-data commands to convert between both layouts, and the
+append command to add occurrences to the store.
+
+The YAML file paths shall be passed as arguments. Directories (all *.yaml files in the
+directory) and glob patterns are also accepted. All files are watched by the same
+observer, and the plots are created in a pool of worker processes.
+
+When the file is modified, only the last date entry and everything that was appended
+after it are parsed again. The full file is parsed only when earlier entries were edited.
+
+The parsed data is cached in a `<YAML name>.cache.npz` file next to the YAML file, so
+a restart skips parsing when the YAML file didn't change. Use `--no-cache` to disable
+the cache.
 
 Usage:
 
-    $ nohup python scatter/metrics/generic/occurrences.py <YAML path> &
+    $ nohup python scatter/metrics/generic/occurrences.py main <YAML path> [<YAML path> ...] &
 
     If you want to log the output, add the following:
 
-    $ nohup python scatter/metrics/generic/occurrences.py <YAML path> 1> ~/occurrences.log 2>&1 &
+    $ nohup python scatter/metrics/generic/occurrences.py main <YAML path> 1> ~/occurrences.log 2>&1 &
+
+    To create the plots only once, e.g. from cron or a hook, use the render command:
+
+    $ python scatter/metrics/generic/occurrences.py render <YAML path> [<YAML path> ...]
+
+    To post occurrences over HTTP on localhost instead of editing the file, start the daemon
+    with `--serve-port <port>` and post e.g. `{"time": "08:15"}` to http://127.0.0.1:<port>/<YAML stem>.
+
+    The daemon prints a summary of the render counters and stage timings every five minutes,
+    use `--stats-interval` to change the interval and `--stats-file` to also write a JSON file.
+    Use `render --timings` to print the stage timings of a single render.
 
 """
 
+from __future__ import annotations
+
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from dataclasses import field
 from pathlib import Path
+from typing import Annotated
+from typing import TYPE_CHECKING
+import bisect
+import collections
+import contextlib
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import re
+import threading
 import time
 import datetime
 import rich
@@ -37,103 +93,760 @@ import queue
 import rich.traceback
 from watchdog.events import FileSystemEvent
 from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileCreatedEvent
 from watchdog.events import FileModifiedEvent
-from watchdog.observers import Observer
+from watchdog.events import FileMovedEvent
 
 import typer
 
-import pandas as pd
-from ruamel import yaml
-from ruamel.yaml.scanner import ScannerError
+# The heavy packages (numpy, pandas, matplotlib, ruamel, the watchdog observer) are imported
+# in the functions that use them. This keeps the start-up time of the CLI short, e.g. the
+# watchdog observer is not imported by the render command.
 
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.ticker import FixedLocator, FixedFormatter
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 HERE = Path(__file__).parent
-# YAML_PATH = HERE / "occurrences.yaml"
-YAML_PATH = None
 
-# The following variables will be overwritten with entries from the YAML file.
+# Default values for the configuration, these can be overwritten by entries in the YAML file.
 
-WATCH_PATH = HERE
-PNG_PATH = HERE
 PNG_FILE = "occurrences.png"
 
 FIG_TITLE = "Event occurrences during the day"
 TOP_AXIS_LABEL = "Occurrences in the day"
 
+# The lower panel shows each occurrence as a point ('scatter'), or a 2D histogram of the
+# occurrences binned per (date, hour) ('density'). With 'auto' the density mode is used
+# when the number of occurrences is larger than the density threshold.
 
-def set_fig_title(data: dict):
-    global FIG_TITLE
+RENDER_MODES = ("scatter", "density", "auto")
+RENDER_MODE = "auto"
+DENSITY_THRESHOLD = 200_000
 
-    FIG_TITLE = data.get("title", FIG_TITLE)
+# The number of bins for the density plot, the dates are grouped when there are more days.
 
+DENSITY_MAX_DAY_BINS = 1000
+DENSITY_HOUR_BINS = 48
 
-def set_top_axis_label(data: dict):
-    global TOP_AXIS_LABEL
+# A 'treatment' annotation has a start and an end date, a 'marker' annotation only one date.
 
-    TOP_AXIS_LABEL = data.get("top_axis_label", TOP_AXIS_LABEL)
+ANNOTATION_KINDS = ("treatment", "marker")
 
+# A view renders a trailing window of days ('30d'), the full history ('all'), or the mean
+# number of occurrences per day for each week ('weekly') or month ('monthly').
 
-def set_watch_path(yaml_file: Path, data: dict):
-    global WATCH_PATH
+VIEW_RESOLUTIONS = ("day", "week", "month")
+VIEW_WINDOW_PATTERN = re.compile(r"^(?P<days>\d+)d$")
 
-    watch_path = data.get("watch_path", "__here__")
+# The output formats, 'png' and 'svg' are saved from the matplotlib figure, 'html' is an
+# interactive Bokeh plot. When more than one format is requested, the formats are exported
+# concurrently in worker processes from the same parsed occurrences. This is only done on
+# a machine with more than one CPU and for at least EXPORT_POOL_THRESHOLD occurrences,
+# smaller plots are exported faster than the worker processes import pandas and matplotlib.
+
+EXPORT_FORMATS = ("png", "svg", "html")
+EXPORT_POOL_THRESHOLD = 250_000
+
+# Events for the watched file are coalesced until no new event arrived for this many seconds.
+
+DEBOUNCE_DELAY = 1.0
+
+# The daemon reports a rolling summary of the stage timings of the last renders.
+
+STATS_WINDOW = 100
+STATS_INTERVAL = 300
+
+# The ingest endpoint only listens on the loopback interface. Posted occurrences are
+# buffered and written to the data file (or the store) in one batch per flush interval.
+
+INGEST_HOST = "127.0.0.1"
+FLUSH_INTERVAL = 5.0
+
+# Used to locate the 'data:' section, the date keys, and a top-level key after the data section
+# in the raw YAML content.
+# Only block style mappings are supported, i.e. one date key per line.
+
+DATA_SECTION_PATTERN = re.compile(rb"^data:[ \t]*(#.*)?$", re.MULTILINE)
+DATE_KEY_PATTERN = re.compile(rb"^[ \t]+['\"]?(\d{4}-\d{2}-\d{2})['\"]?[ \t]*:", re.MULTILINE)
+TOP_LEVEL_KEY_PATTERN = re.compile(rb"^[^\s#]", re.MULTILINE)
+
+# Time strings are 'HH:MM' with an optional suffix: R (red), Z (black), or D (not handled yet).
+
+TIME_PATTERN = r"^(?P<hour>\d{1,2}):(?P<minute>\d{2})(?P<flag>[RrZzDd]?)$"
+
+# The parsed columns are cached in a NumPy file next to the YAML file. Increment the
+# version when the layout of the cache file changes, older cache files are then ignored.
+
+CACHE_SUFFIX = ".cache.npz"
+CACHE_VERSION = 1
+
+
+def _to_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value))
+
+
+@dataclass(frozen=True)
+class Annotation:
+    """
+    An annotation in the counts panel.
+
+    A 'treatment' annotation marks the start and the end of a treatment period, a 'marker'
+    annotation points to a single date (the start date).
+    """
+
+    start: datetime.date
+    end: datetime.date | None = None
+    label: str = ""
+    end_label: str = ""
+    kind: str = "marker"
+    y: float | None = None
+    end_y: float | None = None
+    ha: str | None = None
+    va: str | None = None
+
+    @property
+    def last(self) -> datetime.date:
+        return self.end or self.start
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Annotation:
+        kind = data.get("kind", "marker")
+        if kind not in ANNOTATION_KINDS:
+            raise ValueError(f"Invalid annotation kind '{kind}', expected one of {ANNOTATION_KINDS}")
+
+        return cls(
+            start=_to_date(data["start"]),
+            end=_to_date(data["end"]) if data.get("end") else None,
+            label=str(data.get("label", "")),
+            end_label=str(data.get("end_label", "")),
+            kind=kind,
+            y=data.get("y"),
+            end_y=data.get("end_y"),
+            ha=data.get("ha"),
+            va=data.get("va"),
+        )
+
+
+@dataclass(frozen=True)
+class Annotations:
+    """
+    The annotations sorted on their start date.
+
+    The annotations that overlap with a date range are found with a bisect on the start
+    dates, so only the annotations in or near the plotted range are ever looked at.
+    """
+
+    items: tuple[Annotation, ...] = ()
+    _starts: tuple[int, ...] = field(default=(), init=False, repr=False, compare=False)
+    _max_span: int = field(default=0, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        items = tuple(sorted(self.items, key=lambda x: x.start))
+        object.__setattr__(self, "items", items)
+        object.__setattr__(self, "_starts", tuple(x.start.toordinal() for x in items))
+        object.__setattr__(self, "_max_span", max(((x.last - x.start).days for x in items), default=0))
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_yaml(cls, data: list[dict] | None) -> Annotations:
+        return cls(tuple(Annotation.from_dict(x) for x in data or []))
+
+    def overlapping(self, first: datetime.date, last: datetime.date) -> list[Annotation]:
+        """Returns the annotations that overlap with the date range [first, last]."""
+        # An annotation that overlaps can not start earlier than the longest annotation before first.
+        lo = bisect.bisect_left(self._starts, first.toordinal() - self._max_span)
+        hi = bisect.bisect_right(self._starts, last.toordinal())
+
+        return [x for x in self.items[lo:hi] if x.last >= first]
+
+
+@dataclass(frozen=True)
+class View:
+    """
+    One rendered view of the occurrences.
+
+    A view without a name writes the PNG file from the configuration, a named view writes
+    '<png stem>-<name>.png', e.g. 'occurrences-30d.png'. The window is the number of days
+    up to and including the last day in the data, None is the full history.
+    """
+
+    name: str | None = None
+    window: int | None = None
+    resolution: str = "day"
+
+    def __post_init__(self):
+        if self.resolution not in VIEW_RESOLUTIONS:
+            raise ValueError(f"Invalid view resolution '{self.resolution}', expected one of {VIEW_RESOLUTIONS}")
+        if self.window is not None and self.window < 1:
+            raise ValueError(f"Invalid view window '{self.window}', expected a positive number of days")
+
+    def png_file(self, png_file: str) -> str:
+        if self.name is None:
+            return png_file
+
+        png_file = Path(png_file)
+        return f"{png_file.stem}-{self.name}{png_file.suffix}"
+
+    @property
+    def title(self) -> str:
+        parts = []
+        if self.window is not None:
+            parts.append(f"last {self.window} days")
+        if self.resolution != "day":
+            parts.append(f"{self.resolution}ly mean")
+        return f" ({', '.join(parts)})" if parts else ""
+
+    @classmethod
+    def from_yaml(cls, data: str | dict) -> View:
+        """
+        A view is given as a short name ('all', 'weekly', 'monthly', '<N>d'), or as a mapping
+        with the keys 'name', 'window' (days), and 'resolution' (day, week, or month).
+        """
+        if isinstance(data, dict):
+            window = data.get("window")
+            return cls(
+                name=str(data["name"]),
+                window=int(window) if window is not None else None,
+                resolution=data.get("resolution", "day"),
+            )
+
+        name = str(data)
+        if name == "all":
+            return cls(name)
+        if name == "weekly":
+            return cls(name, resolution="week")
+        if name == "monthly":
+            return cls(name, resolution="month")
+        if match := VIEW_WINDOW_PATTERN.match(name):
+            return cls(name, window=int(match["days"]))
+
+        raise ValueError(f"Invalid view '{name}', expected 'all', 'weekly', 'monthly', or '<days>d'")
+
+
+def _resolve_path(yaml_file: Path, path: str) -> Path:
+    return yaml_file.parent if path == "__here__" else Path(path)
+
+
+def _resolve_store(yaml_file: Path, path: str | None) -> Path | None:
+    """A relative store path is relative to the folder of the YAML file."""
+    return yaml_file.parent / Path(path).expanduser() if path else None
+
+
+@dataclass(frozen=True)
+class OccurrencesConfig:
+    """
+    The configuration for one YAML file, i.e. the entries from the YAML file that are not data.
+
+    The configuration is passed around explicitly instead of being kept in module globals,
+    so that plots for different files can be created concurrently.
+    """
+
+    yaml_file: Path
+    watch_path: Path
+    png_path: Path
+    png_file: str = PNG_FILE
+    fig_title: str = FIG_TITLE
+    top_axis_label: str = TOP_AXIS_LABEL
+    render_mode: str = RENDER_MODE
+    density_threshold: int = DENSITY_THRESHOLD
+    annotations: Annotations = field(default_factory=Annotations)
+    views: tuple[View, ...] = (View(),)
+    formats: tuple[str, ...] = ("png",)
+    store: Path | None = None
+
+    def __post_init__(self):
+        if self.render_mode not in RENDER_MODES:
+            raise ValueError(f"Invalid render_mode '{self.render_mode}' in {self.yaml_file}, expected one of {RENDER_MODES}")
+        for fmt in self.formats:
+            if fmt not in EXPORT_FORMATS:
+                raise ValueError(f"Invalid format '{fmt}' in {self.yaml_file}, expected one of {EXPORT_FORMATS}")
+
+    @property
+    def png(self) -> Path:
+        return self.png_path / self.png_file
+
+    def use_density(self, n_occurrences: int) -> bool:
+        if self.render_mode == "auto":
+            return n_occurrences > self.density_threshold
+
+        return self.render_mode == "density"
+
+    def output_for(self, view: View, fmt: str = "png") -> Path:
+        """Returns the output file for the view, the suffix of the PNG file is replaced by the format."""
+        return (self.png_path / view.png_file(self.png_file)).with_suffix(f".{fmt}")
+
+    @classmethod
+    def from_yaml(cls, yaml_file: Path, data: dict) -> "OccurrencesConfig":
+        yaml_file = Path(yaml_file)
+
+        return cls(
+            yaml_file=yaml_file,
+            watch_path=_resolve_path(yaml_file, data.get("watch_path", "__here__")),
+            png_path=_resolve_path(yaml_file, data.get("png_path", "__here__")),
+            png_file=data.get("png_file", PNG_FILE),
+            fig_title=data.get("title", FIG_TITLE),
+            top_axis_label=data.get("top_axis_label", TOP_AXIS_LABEL),
+            render_mode=data.get("render_mode", RENDER_MODE),
+            density_threshold=int(data.get("density_threshold", DENSITY_THRESHOLD)),
+            annotations=Annotations.from_yaml(data.get("annotations")),
+            views=tuple(View.from_yaml(x) for x in data["views"]) if data.get("views") else (View(),),
+            formats=tuple(str(x).lower() for x in data.get("formats") or ["png"]),
+            store=_resolve_store(yaml_file, data.get("store")),
+        )
+
+
+# The ordinal of 1970-01-01, the epoch of numpy datetime64 values
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# The window in days for the centered rolling mean of the occurrences per day
+
+WINDOW_DAYS = 7
+
+
+def _to_ordinal(date) -> int:
+    return datetime.date.fromisoformat(str(date)[:10]).toordinal()
+
+
+class DailyCounts:
+    """
+    The number of occurrences per day, kept in an array that is indexed by the day ordinal.
+
+    The counts are maintained incrementally: adding an occurrence updates one bucket, and
+    the centered rolling mean is only recomputed for the days whose window contains an
+    updated bucket. Days without occurrences between the first and the last day count as 0.
+    """
+
+    def __init__(self, first_ordinal: int, counts, window: int = WINDOW_DAYS):
+        import numpy as np
+
+        self.first_ordinal = first_ordinal
+        self.window = window
+        self._size = len(counts)
+        self._counts = np.zeros(max(self._size, 1) * 2, dtype=np.int64)
+        self._counts[: self._size] = counts
+        self._mean = np.full(len(self._counts), np.nan)
+        self._dirty: tuple[int, int] | None = (0, self._size - 1) if self._size else None
+
+    @classmethod
+    def from_ordinals(cls, ordinals, window: int = WINDOW_DAYS) -> DailyCounts:
+        import numpy as np
+
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+
+        if not len(ordinals):
+            return cls(0, [], window=window)
+
+        first_ordinal = int(ordinals.min())
+
+        return cls(first_ordinal, np.bincount(ordinals - first_ordinal), window=window)
+
+    @classmethod
+    def from_dates(cls, dates, window: int = WINDOW_DAYS) -> DailyCounts:
+        """Create the daily counts from datetime64 values, e.g. the 'date' column of the occurrences."""
+        import numpy as np
+
+        days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+        return cls.from_ordinals(days + EPOCH_ORDINAL, window=window)
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple], window: int = WINDOW_DAYS) -> DailyCounts:
+        """Create the daily counts from (date, time) rows as they are read from the YAML file."""
+        return cls.from_ordinals([_to_ordinal(date) for date, _ in rows], window=window)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def total(self) -> int:
+        return int(self._counts[: self._size].sum())
+
+    @property
+    def counts(self):
+        """The number of occurrences for each day, from the first to the last day."""
+        return self._counts[: self._size]
+
+    @property
+    def dates(self):
+        """The days as datetime64[D] values."""
+        import numpy as np
+
+        return (np.arange(self._size) + (self.first_ordinal - EPOCH_ORDINAL)).astype("datetime64[D]")
+
+    def _mark_dirty(self, lo: int, hi: int):
+        self._dirty = (lo, hi) if self._dirty is None else (min(self._dirty[0], lo), max(self._dirty[1], hi))
+
+    def _grow(self, index: int) -> int:
+        """Make room for the bucket at the given index, returns the index after growing."""
+        import numpy as np
+
+        if self._size == 0:
+            self.first_ordinal += index
+            index = 0
+        elif index < 0:
+            # Rare, a day before the first day was added, shift all the buckets.
+            self._counts = np.concatenate([np.zeros(-index, dtype=np.int64), self._counts])
+            self._mean = np.concatenate([np.full(-index, np.nan), self._mean])
+            self._size -= index
+            self.first_ordinal += index
+            if self._dirty:
+                self._dirty = (self._dirty[0] - index, self._dirty[1] - index)
+            # The new (empty) days up to the previous first day change the windows around them
+            self._mark_dirty(0, -index)
+            return 0
+
+        if index >= len(self._counts):
+            capacity = max(index + 1, 2 * len(self._counts))
+            self._counts = np.concatenate([self._counts, np.zeros(capacity - len(self._counts), dtype=np.int64)])
+            self._mean = np.concatenate([self._mean, np.full(capacity - len(self._mean), np.nan)])
+
+        if index >= self._size:
+            # The new (empty) days complete the windows of the previous last days
+            self._mark_dirty(self._size, index)
+            self._size = index + 1
+
+        return index
+
+    def add(self, date, count: int = 1):
+        """Add (or remove, when count is negative) occurrences for the given date."""
+        self._add_ordinal(_to_ordinal(date), count)
+
+    def _add_ordinal(self, ordinal: int, count: int):
+        index = self._grow(ordinal - self.first_ordinal)
+
+        self._counts[index] += count
+        self._mark_dirty(index, index)
+
+    def add_ordinals(self, ordinals, count: int = 1):
+        """Add the occurrences for the day ordinals, the bucket of each day is updated once."""
+        import numpy as np
+
+        days, day_counts = np.unique(np.asarray(ordinals, dtype=np.int64), return_counts=True)
+
+        for day, day_count in zip(days.tolist(), day_counts.tolist()):
+            self._add_ordinal(day, day_count * count)
+
+    def add_rows(self, rows: list[tuple], count: int = 1):
+        for date, _ in rows:
+            self.add(date, count)
+
+    def rolling_mean(self):
+        """
+        The centered rolling mean over `window` days, NaN where the window is not complete.
+
+        This gives the same result as pandas' `rolling(window, center=True).mean()`.
+        """
+        import numpy as np
+
+        if self._dirty is not None:
+            left = self.window // 2
+            right = self.window - left - 1
+
+            # The dirty buckets are part of the windows of the days [lo - right, hi + left]
+
+            lo = max(self._dirty[0] - right, 0)
+            hi = min(self._dirty[1] + left, self._size - 1)
+
+            self._mean[lo : hi + 1] = np.nan
+
+            start = max(lo, left)
+            stop = min(hi, self._size - 1 - right)
+
+            if start <= stop:
+                window_sums = np.convolve(
+                    self._counts[start - left : stop + right + 1], np.ones(self.window), mode="valid"
+                )
+                self._mean[start : stop + 1] = window_sums / self.window
+
+            self._dirty = None
+
+        return self._mean[: self._size]
+
+    def resample(self, resolution: str, start: int = 0):
+        """
+        Returns the first day of each week (starting on Monday) or month, and the mean number
+        of occurrences per day in that period, for the days from index start onwards.
+        """
+        import numpy as np
+
+        dates = self.dates[start:]
+        counts = self.counts[start:]
+
+        if not len(counts):
+            return dates, np.zeros(0)
+
+        days = dates.astype(np.int64)
+        if resolution == "week":
+            # 1970-01-01, day 0, is a Thursday
+            periods = (days + 3) // 7
+        else:
+            periods = dates.astype("datetime64[M]").astype(np.int64)
+
+        # The days are consecutive, so each period is one contiguous run of days
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(periods)) + 1])
+        lengths = np.diff(np.append(starts, len(counts)))
+
+        return dates[starts], np.add.reduceat(counts, starts) / lengths
+
+
+@dataclass
+class IngestState:
+    """The state of the YAML file as it was parsed during the previous read."""
+
+    size: int
+    mtime_ns: int
+    last_key: str
+    """The last date key in the data section, all data from this key onwards is re-parsed."""
+    tail_offset: int
+    """Byte offset of the line that contains the last date key."""
+    prefix_digest: bytes
+    """Digest of all the bytes before the tail offset, used to detect edits in earlier entries."""
+    config: dict
+    header_config: dict = field(default_factory=dict)
+    """The top-level keys before the data section, the keys after it are parsed again with the tail."""
+    prefix_rows: list[tuple] = field(default_factory=list)
+    tail_rows: list[tuple] = field(default_factory=list)
+    daily: DailyCounts | None = None
+
+    @property
+    def rows(self) -> list[tuple]:
+        return self.prefix_rows + self.tail_rows
 
-    if watch_path == "__here__":
-        WATCH_PATH = yaml_file.parent
-    else:
-        WATCH_PATH = Path(watch_path)
 
+# The ingest state for each YAML file that was read with incremental=True
 
-def set_png_path(yaml_file: Path, data: dict):
-    global PNG_PATH
+_INGEST_STATE: dict[Path, IngestState] = {}
 
-    png_path = data.get("png_path", "__here__")
 
-    if png_path == "__here__":
-        PNG_PATH = yaml_file.parent
+def load_yaml(content: bytes) -> dict:
+    """Returns the top-level mapping of the YAML content, an empty dict for an empty file."""
+    from ruamel import yaml
+
+    yaml_fd = yaml.YAML(typ="safe")
+    return yaml_fd.load(content) or {}
+
+
+def _to_rows(data: dict) -> list[tuple]:
+    return [(date, time) for date, times_list in data.items() for time in times_list]
+
+
+def _digest(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+def _split_rows(data: dict, last_key: str) -> tuple[list[tuple], list[tuple]]:
+    """Split the data in the rows before the last key and the rows for the last key."""
+    prefix_data = {date: times_list for date, times_list in data.items() if str(date) != last_key}
+    tail_data = {date: times_list for date, times_list in data.items() if str(date) == last_key}
+
+    return _to_rows(prefix_data), _to_rows(tail_data)
+
+
+def _find_last_key(content: bytes, start: int = 0) -> tuple[int, str] | None:
+    """Returns the byte offset and the value of the last date key in the content, or None."""
+    match = None
+    for match in DATE_KEY_PATTERN.finditer(content, start):
+        pass
+
+    if match is None:
+        return None
+
+    return match.start(), match.group(1).decode()
+
+
+def _full_parse(content: bytes, stat) -> tuple[dict, list[tuple], IngestState | None]:
+    data = load_yaml(content)
+    config = {key: value for key, value in data.items() if key != "data"}
+    rows = _to_rows(data.get("data") or {})
+
+    # Remember where the last date key starts, so that the next read only needs to
+    # parse from there. When the data section or a date key can not be located in the
+    # raw content, no state is kept and the next read will be a full parse again.
+
+    data_section = DATA_SECTION_PATTERN.search(content)
+    last = _find_last_key(content, data_section.end()) if data_section else None
+
+    if last is None:
+        return config, rows, None
+
+    tail_offset, last_key = last
+    prefix_rows, tail_rows = _split_rows(data["data"], last_key)
+
+    keys = list(data)
+    header_config = {key: data[key] for key in keys[: keys.index("data")]}
+
+    state = IngestState(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        last_key=last_key,
+        tail_offset=tail_offset,
+        prefix_digest=_digest(content[:tail_offset]),
+        config=config,
+        header_config=header_config,
+        prefix_rows=prefix_rows,
+        tail_rows=tail_rows,
+        daily=DailyCounts.from_rows(rows),
+    )
+
+    return config, rows, state
+
+
+def _tail_parse(content: bytes, stat, state: IngestState) -> tuple[dict, list[tuple], IngestState]:
+    """Parse only the content from the last known date key onwards."""
+    tail = content[state.tail_offset :]
+    data = load_yaml(b"data:\n" + tail)
+
+    # Top-level keys that come after the data section end up in the tail. The config is
+    # rebuilt from the header, so keys that were removed from the tail are dropped.
+
+    config = state.header_config | {key: value for key, value in data.items() if key != "data"}
+    tail_data = data.get("data") or {}
+
+    offset, last_key = _find_last_key(tail)
+    tail_offset = state.tail_offset + offset
+
+    new_prefix_rows, tail_rows = _split_rows(tail_data, last_key)
+
+    # Only the days in the tail changed, remove the previous tail and add the new one
+
+    daily = state.daily
+    daily.add_rows(state.tail_rows, -1)
+    daily.add_rows(new_prefix_rows + tail_rows)
+
+    new_state = IngestState(
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        last_key=last_key,
+        tail_offset=tail_offset,
+        prefix_digest=state.prefix_digest if tail_offset == state.tail_offset else _digest(content[:tail_offset]),
+        config=config,
+        header_config=state.header_config,
+        prefix_rows=state.prefix_rows + new_prefix_rows,
+        tail_rows=tail_rows,
+        daily=daily,
+    )
+
+    return config, new_state.rows, new_state
+
+
+def read_rows(yaml_file: Path, incremental: bool) -> tuple[dict, list[tuple]]:
+    """
+    Returns the configuration and the (date, time) rows from the YAML file.
+
+    When incremental is True, the state of the previous read is used to parse only the
+    part of the data section that was changed or appended, i.e. the last date entry and
+    everything that follows. A full parse is done when the earlier entries or the header
+    of the file were edited.
+    """
+    yaml_file = Path(yaml_file).resolve()
+
+    if not incremental:
+        _INGEST_STATE.pop(yaml_file, None)
+        with open(yaml_file, "rb") as fd:
+            config, rows, _ = _full_parse(fd.read(), yaml_file.stat())
+        return config, rows
+
+    stat = yaml_file.stat()
+    state = _INGEST_STATE.get(yaml_file)
+
+    if state and state.size == stat.st_size and state.mtime_ns == stat.st_mtime_ns:
+        return state.config, state.rows
+
+    with open(yaml_file, "rb") as fd:
+        content = fd.read()
+
+    if (
+        state is None
+        or DATE_KEY_PATTERN.match(content, state.tail_offset) is None
+        or _digest(content[: state.tail_offset]) != state.prefix_digest
+    ):
+        config, rows, state = _full_parse(content, stat)
+    else:
+        config, rows, state = _tail_parse(content, stat, state)
+
+    if state is None:
+        _INGEST_STATE.pop(yaml_file, None)
     else:
-        PNG_PATH = Path(png_path)
+        _INGEST_STATE[yaml_file] = state
+
+    return config, rows
+
+
+class StageTimer:
+    """
+    Collects the wall-clock time in seconds of the stages of a render, e.g. reading the
+    YAML file, building the DataFrame, parsing the times, and saving the figures.
+    The time of a stage that is entered more than once is accumulated.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
 
+    def update(self, stages: dict[str, float]):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
 
-def set_png_file(data: dict):
-    global PNG_FILE
 
-    PNG_FILE = data.get("png_file", PNG_FILE)
+def daily_counts(yaml_file: Path, df: pd.DataFrame, store: Path | None = None) -> DailyCounts:
+    """
+    Returns the number of occurrences per day for the YAML file, or for the store when given.
 
+    The incrementally maintained counts are used when they match the current content of
+    the file, otherwise the counts are calculated from the 'date' column of the occurrences.
+    """
+    if store is not None:
+        from metrics.generic.occurrences_store import _STORE_STATE
 
-def set_global_variables(yaml_file: Path, data: dict):
-    set_watch_path(yaml_file, data)
-    set_png_path(yaml_file, data)
-    set_png_file(data)
-    set_fig_title(data)
-    set_top_axis_label(data)
+        state = _STORE_STATE.get(Path(store).resolve())
+        if state and state.daily.total == len(df):
+            return state.daily
+        return DailyCounts.from_dates(df["date"].to_numpy())
 
-    # rich.print({
-    #     'YAML_PATH': YAML_PATH,
-    #     'WATCH_PATH': WATCH_PATH,
-    #     'PNG_PATH': PNG_PATH,
-    #     'PNG_FILE': PNG_FILE,
-    #     'FIG_TITLE': FIG_TITLE,
-    # })
+    yaml_file = Path(yaml_file).resolve()
+    state = _INGEST_STATE.get(yaml_file)
 
+    if state and state.daily is not None and state.daily.total == len(df):
+        stat = yaml_file.stat()
+        if state.size == stat.st_size and state.mtime_ns == stat.st_mtime_ns:
+            return state.daily
 
-def read_data(yaml_file):
-    with open(yaml_file) as fd:
-        yaml_fd = yaml.YAML(typ="safe")
-        data = yaml_fd.load(fd)
+    return DailyCounts.from_dates(df["date"].to_numpy())
 
-    set_global_variables(yaml_file, data)
+
+def read_data(
+    yaml_file, incremental: bool = True, timer: StageTimer | None = None
+) -> tuple[OccurrencesConfig, pd.DataFrame]:
+    import pandas as pd
+
+    timer = timer or StageTimer()
+
+    with timer.stage("read"):
+        config, rows = read_rows(yaml_file, incremental)
 
     # Convert the data to a pandas DataFrame
-    df = pd.DataFrame(
-        [(date, time) for date, times_list in data["data"].items() for time in times_list],
-        columns=["date", "time"],
-    )
+    with timer.stage("dataframe"):
+        df = pd.DataFrame(rows, columns=["date", "time"])
 
-    return df
+    return OccurrencesConfig.from_yaml(yaml_file, config), df
 
 
 def parse_time_with_color(time_str):
@@ -175,7 +888,191 @@ def parse_time_with_color(time_str):
     # return clean_time, False, False
 
 
+def split_times(times: pd.Series) -> tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Split the time strings into their parts and validate them, raises a ValueError for invalid times.
+
+    Returns the extracted 'hour', 'minute', and 'flag' strings, the hours and the minutes as
+    numbers, and the lowercase flags ('r', 'z', 'd', or '').
+    """
+    import pandas as pd
+
+    parts = times.astype(str).str.extract(TIME_PATTERN)
+
+    hours = pd.to_numeric(parts["hour"]).to_numpy()
+    minutes = pd.to_numeric(parts["minute"]).to_numpy()
+
+    invalid = ~((hours < 24) & (minutes < 60))  # also catches NaN, i.e. no match
+    if invalid.any():
+        raise ValueError(
+            f"Invalid time string(s), expected 'HH:MM' with an optional R, Z, or D suffix: "
+            f"{times[invalid].unique().tolist()}"
+        )
+
+    return parts, hours.astype(int), minutes.astype(int), parts["flag"].str.lower().to_numpy()
+
+
+def parse_times(times: pd.Series) -> pd.DataFrame:
+    """
+    Parse all time strings in one pass, this is the columnar version of parse_time_with_color().
+
+    Returns a DataFrame with the same index as `times` and the columns 'time' (the time string
+    without suffix), 'is_red', 'is_black', and 'time_numeric' (the time in hours since midnight).
+    """
+    import pandas as pd
+
+    parts, hours, minutes, flags = split_times(times)
+
+    return pd.DataFrame(
+        {
+            "time": parts["hour"] + ":" + parts["minute"],
+            "is_red": flags == "r",
+            "is_black": flags == "z",
+            "time_numeric": (hours * 60 + minutes) / 60.0,
+        },
+        index=times.index,
+    )
+
+
+def cache_path(yaml_file: Path) -> Path:
+    """Returns the location of the columnar cache for the given YAML file."""
+    return yaml_file.with_name(yaml_file.stem + CACHE_SUFFIX)
+
+
+def read_cache(yaml_file: Path, digest: bytes) -> tuple[dict, pd.DataFrame] | None:
+    """
+    Returns the configuration and the parsed occurrences from the cache file.
+
+    None is returned when there is no cache, when it was created from a different version
+    of the YAML file, i.e. the content digest doesn't match, or when it can not be read.
+    """
+    import numpy as np
+    import pandas as pd
+
+    try:
+        with np.load(cache_path(yaml_file), allow_pickle=False) as cache:
+            if int(cache["version"]) != CACHE_VERSION or cache["digest"].tobytes() != digest:
+                return None
+            config = json.loads(str(cache["config"]))
+            df = pd.DataFrame(
+                {
+                    "date": pd.to_datetime(cache["date"]),
+                    "time_numeric": cache["time_numeric"],
+                    "is_red": cache["is_red"],
+                    "is_black": cache["is_black"],
+                }
+            )
+    except (OSError, KeyError, ValueError) as exc:
+        if not isinstance(exc, FileNotFoundError):
+            rich.print(f"[yellow]WARNING: Ignoring cache file {cache_path(yaml_file)}: {exc}[/]")
+        return None
+
+    return config, df
+
+
+def write_cache(yaml_file: Path, digest: bytes, config: dict, df: pd.DataFrame):
+    """Save the parsed occurrences next to the YAML file, the cache is replaced atomically."""
+    import numpy as np
+
+    path = cache_path(yaml_file)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+
+    try:
+        with open(tmp_path, "wb") as fd:
+            np.savez(
+                fd,
+                version=np.array(CACHE_VERSION),
+                digest=np.frombuffer(digest, dtype=np.uint8),
+                config=np.array(json.dumps(config, default=str)),
+                date=df["date"].to_numpy(dtype="datetime64[D]"),
+                time_numeric=df["time_numeric"].to_numpy(dtype=np.float64),
+                is_red=df["is_red"].to_numpy(dtype=bool),
+                is_black=df["is_black"].to_numpy(dtype=bool),
+            )
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        rich.print(f"[yellow]WARNING: Could not write cache file {path}: {exc}[/]")
+        tmp_path.unlink(missing_ok=True)
+
+
+def load_data(
+    yaml_file, use_cache: bool = True, timer: StageTimer | None = None, incremental: bool = True
+) -> tuple[OccurrencesConfig, pd.DataFrame]:
+    """
+    Returns the configuration and the occurrences, sorted on date, with the parsed columns
+    'date', 'time_numeric', 'is_red', and 'is_black'.
+
+    When use_cache is True, the columns are loaded from the cache file if the content of the
+    YAML file didn't change since the cache was written. Otherwise, the YAML file is parsed
+    and the cache is (re-)written.
+
+    When the YAML file configures a store, the occurrences are read from the store and the
+    cache is not used, the records that were appended since the previous read are read only.
+
+    With incremental=False, the YAML file is always parsed from scratch, see read_rows().
+    """
+    import pandas as pd
+
+    yaml_file = Path(yaml_file)
+    timer = timer or StageTimer()
+
+    if use_cache:
+        with timer.stage("cache read"):
+            with open(yaml_file, "rb") as fd:
+                digest = _digest(fd.read())
+            cached = read_cache(yaml_file, digest)
+        if cached and not cached[0].get("store"):
+            config, df = cached
+            return OccurrencesConfig.from_yaml(yaml_file, config), df
+
+    with timer.stage("read"):
+        config, rows = read_rows(yaml_file, incremental=incremental)
+
+    if store := _resolve_store(yaml_file, config.get("store")):
+        from metrics.generic.occurrences_store import read_store_records
+        from metrics.generic.occurrences_store import store_frame
+
+        with timer.stage("store"):
+            records, _ = read_store_records(store)
+
+        with timer.stage("dataframe"):
+            df = store_frame(records)
+            if not df["date"].is_monotonic_increasing:
+                df = df.sort_values("date", kind="stable", ignore_index=True)
+
+        return OccurrencesConfig.from_yaml(yaml_file, config), df
+
+    with timer.stage("dataframe"):
+        df = pd.DataFrame(rows, columns=["date", "time"])
+
+        # Convert date and time columns to datetime
+        df["date"] = pd.to_datetime(df["date"])
+
+    with timer.stage("parse"):
+        # Split the time strings in the clean time, the color flags and the time in hours since midnight
+        df[["time", "is_red", "is_black", "time_numeric"]] = parse_times(df["time"])
+
+        # The views slice the date range with a binary search, this needs the dates sorted.
+        if not df["date"].is_monotonic_increasing:
+            df = df.sort_values("date", kind="stable", ignore_index=True)
+
+    if use_cache:
+        with timer.stage("cache write"):
+            write_cache(yaml_file, digest, config, df)
+
+    return OccurrencesConfig.from_yaml(yaml_file, config), df
+
+
+def format_minutes(minutes) -> np.ndarray:
+    """Returns the 'HH:MM' time strings for the minutes since midnight."""
+    import numpy as np
+
+    return np.array([f"{x // 60:02d}:{x % 60:02d}" for x in range(24 * 60)], dtype=object)[minutes]
+
+
 def format_seondary_yaxis(ax, yticks, yticks_lim, ytick_labels, ylabel):
+    from matplotlib.ticker import FixedLocator
+
     ax.set_ylim(*yticks_lim)
     ax.set_yticks(yticks)
     ax.set_yticklabels(ytick_labels)
@@ -184,10 +1081,13 @@ def format_seondary_yaxis(ax, yticks, yticks_lim, ytick_labels, ylabel):
 
 
 def anntotate_entyvio(ax, date, y, label, ha: str = "center", va: str = "bottom", relpos: tuple = (0.5, 0)):
-    """Annotate the plot with Entyvio treatment periods."""
+    """Annotate the plot with Entyvio treatment periods, returns the created annotations."""
+    import matplotlib.dates as mdates
+
+    artists = []
     if date:
         date_num = mdates.date2num(date)
-        ax.annotate(
+        artist = ax.annotate(
             label,
             xy=(date_num, y),
             xytext=(date_num, y + 2),
@@ -201,6 +1101,9 @@ def anntotate_entyvio(ax, date, y, label, ha: str = "center", va: str = "bottom"
                 connectionstyle="arc3,rad=0",  # Straight line (no curve)
             ),
         )
+        artists.append(artist)
+
+    return artists
 
 
 def annotate_antibiotic_treatment(
@@ -216,11 +1119,14 @@ def annotate_antibiotic_treatment(
     elha="right",
     elva="top",
 ):
-    """Annotate the plot with antibiotic treatment periods."""
+    """Annotate the plot with antibiotic treatment periods, returns the created annotations."""
+    import matplotlib.dates as mdates
+
+    artists = []
     relpos = {"left": 0, "center": 0.5, "right": 1}
     if start_date:
         start_date_num = mdates.date2num(start_date)
-        ax.annotate(
+        artist = ax.annotate(
             start_label,
             xy=(start_date_num, start_y),
             xytext=(start_date_num, start_y + 3),
@@ -233,11 +1139,12 @@ def annotate_antibiotic_treatment(
                 connectionstyle="arc3,rad=0",  # Straight line (no curve)
             ),
         )
+        artists.append(artist)
 
     if end_date:
         # Convert end_date to numerical format
         end_date_num = mdates.date2num(end_date)
-        ax.annotate(
+        artist = ax.annotate(
             end_label,
             xy=(end_date_num, end_y),
             xytext=(end_date_num, end_y - 3),
@@ -250,333 +1157,1093 @@ def annotate_antibiotic_treatment(
                 connectionstyle="arc3,rad=0",  # Straight line (no curve)
             ),
         )
+        artists.append(artist)
+
+    return artists
+
+
+def draw_annotation(ax, annotation: Annotation) -> list:
+    """Draw the annotation on the counts axes, returns the created annotations."""
+    if annotation.kind == "treatment":
+        return annotate_antibiotic_treatment(
+            ax,
+            annotation.start,
+            annotation.end,
+            start_y=annotation.y if annotation.y is not None else 10,
+            end_y=annotation.end_y if annotation.end_y is not None else 4,
+            start_label=annotation.label,
+            end_label=annotation.end_label,
+            slha=annotation.ha or "left",
+            slva=annotation.va or "bottom",
+        )
 
+    ha = annotation.ha or "center"
+    relpos = {"left": 0, "center": 0.5, "right": 1}
 
-def create_plot(timestamp, yaml_file):
-    try:
-        df = read_data(yaml_file)
-    except ScannerError:
-        rich.print(f"[red]ERROR: Error while scanning {yaml_file}[/]")
-        return
+    return anntotate_entyvio(
+        ax,
+        annotation.start,
+        y=annotation.y if annotation.y is not None else 16,
+        label=annotation.label,
+        ha=ha,
+        va=annotation.va or "bottom",
+        relpos=(relpos[ha], 0),
+    )
 
-    # Convert date and time columns to datetime
-    df["date"] = pd.to_datetime(df["date"])
 
-    df[["time", "is_red", "is_black"]] = df["time"].apply(lambda x: pd.Series(parse_time_with_color(x)))
+# When True, all occurrences are plotted in blue, otherwise the R and Z flags are shown in red and black.
 
-    df["time"] = pd.to_datetime(df["time"], format="%H:%M").dt.time
+NO_COLOR = True
 
-    # Convert datetime objects to numerical values
-    df["date_numeric"] = mdates.date2num(df["date"])
 
-    # Convert time to a numeric format (minutes since midnight)
-    df["time_numeric"] = df["time"].apply(lambda x: x.hour * 60 + x.minute) / 60.0
+def occurrence_density(
+    date_numeric, time_numeric, max_day_bins: int = DENSITY_MAX_DAY_BINS, hour_bins: int = DENSITY_HOUR_BINS
+):
+    """
+    Bin the occurrences in a 2D histogram of date versus hour of the day.
 
-    # Plot occurrences
-    # fig, ax1 = plt.subplots(figsize=(10, 6))
-    fig, (ax3, ax1) = plt.subplots(2, 1, gridspec_kw={"height_ratios": [4, 4]}, sharex=True, figsize=(12, 8))
+    There is one bin per day, unless there are more than `max_day_bins` days, then the days
+    are grouped. Returns the counts with shape (hour_bins, day_bins), and the date edges.
+    """
+    import numpy as np
 
-    fig.suptitle(FIG_TITLE, fontsize=16)
+    first_day = np.floor(date_numeric.min())
+    last_day = np.floor(date_numeric.max()) + 1
+    day_bins = int(min(last_day - first_day, max_day_bins))
 
-    # FixedFomatter shall be used with FixedLocator, the locations shall be in the units of the axis, i.e. numeric datetime.
-    fixed_locations = mdates.date2num(df["date"].unique())
-    fixed_labels = df["date"].astype(str).unique().tolist()
+    counts, date_edges, _ = np.histogram2d(
+        date_numeric, time_numeric, bins=(day_bins, hour_bins), range=((first_day, last_day), (0, 24))
+    )
 
-    # Calculate total occurrences per day
-    occurrences_per_day = df["date"].value_counts().sort_index()
+    return counts.T, date_edges
 
-    window_days = 7
 
-    ax3.plot(
-        fixed_locations,
-        occurrences_per_day,
-        color="blue",
-        alpha=0.2,
-        linestyle="-",
-        marker=".",
-        markersize=7,
-        label="Counts",
-    )
+@dataclass
+class ViewData:
+    """The occurrences and the counts per day in the date range of a view."""
 
-    ax3.plot(
-        fixed_locations,
-        occurrences_per_day.rolling(window=window_days, center=True).mean(),
-        color="blue",
-        linestyle="-",
-        # marker="o",
-        # markersize=5,
-        label=f"Rolling mean ({window_days} days)",
-    )
+    df: pd.DataFrame
+    dates: np.ndarray
+    counts: np.ndarray
+    mean_dates: np.ndarray
+    mean: np.ndarray
 
-    ax3.text(
-        0.10,
-        0.90,
-        f"Running mean (w={window_days})",
-        transform=ax3.transAxes,
-        verticalalignment="top",
-        bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.8),
-    )
 
-    annotate_antibiotic_treatment(
-        ax3,
-        datetime.datetime(2025, 1, 27),
-        datetime.datetime(2025, 2, 10),
-        start_y=10,
-        end_y=4,
-        start_label="start ciprofloxacine",
-        end_label="stop antibiotica",
-    )
+def select_view(view: View, df: pd.DataFrame, occurrences_per_day: DailyCounts) -> ViewData:
+    """
+    Returns the data in the date range of the view.
 
-    annotate_antibiotic_treatment(
-        ax3,
-        datetime.datetime(2025, 3, 17),
-        datetime.datetime(2025, 3, 24),
-        start_y=8,
-        end_y=4,
-        start_label="start Flagyl",
-        end_label="stop antibiotica",
-    )
+    The occurrences shall be sorted on date, the view's window is then sliced from the
+    DataFrame and the daily counts without filtering the full history. For a weekly or
+    monthly view, the mean dates are the period starts plus the end of the last day, so
+    the mean can be drawn as steps.
+    """
+    import numpy as np
 
-    annotate_antibiotic_treatment(
-        ax3,
-        datetime.datetime(2025, 6, 23),
-        datetime.datetime(2025, 7, 7),
-        start_y=11,
-        end_y=4,
-        start_label="start ciprofloxacine",
-        end_label="stop antibiotica",
-        slha="right",
-    )
+    # The days are consecutive, so the window in the daily counts is a plain slice
+    start = 0
+    if view.window is not None:
+        start = max(len(occurrences_per_day) - view.window, 0)
+        if start:
+            first_date = occurrences_per_day.dates[start].astype(df["date"].dtype)
+            df = df.iloc[np.searchsorted(df["date"].to_numpy(), first_date, side="left") :]
 
-    annotate_antibiotic_treatment(
-        ax3,
-        datetime.datetime(2025, 7, 28),
-        datetime.datetime(2025, 8, 15),
-        start_y=11,
-        end_y=4,
-        start_label="start ciprofloxacine",
-        end_label="stop antibiotica",
+    dates = occurrences_per_day.dates[start:]
+    counts = occurrences_per_day.counts[start:]
+
+    if view.resolution == "day" or not len(dates):
+        # The mean is calculated over the full history, so it is also correct at the start of the window
+        return ViewData(df, dates, counts, dates, occurrences_per_day.rolling_mean()[start:])
+
+    period_starts, means = occurrences_per_day.resample(view.resolution, start)
+
+    return ViewData(
+        df, dates, counts, np.append(period_starts, dates[-1] + np.timedelta64(1, "D")), np.append(means, means[-1])
     )
 
-    for date, msg, *rest in (
-        (datetime.datetime(2025, 8, 1), "Entyvio 0", "right", "bottom", (1.0, 0)),
-        (datetime.datetime(2025, 8, 14), "+2"),
-        (datetime.datetime(2025, 9, 11), "+4"),
-        (datetime.datetime(2025, 11, 6), "+8"),
-        (datetime.datetime(2025, 12, 30), "+8"),
-        (datetime.datetime(2026, 1, 26), "+4"),
-        (datetime.datetime(2026, 2, 24), "+4"),
-        (datetime.datetime(2026, 3, 26), "+4"),
-        (datetime.datetime(2026, 4, 21), "+4"),
-        (datetime.datetime(2026, 5, 20), "+4"),
-    ):
-        if rest:
-            ha, va, relpos = rest
-            anntotate_entyvio(
-                ax3,
-                date,
-                y=16,
-                label=f"{msg}",
-                ha=ha,
-                va=va,
-                relpos=relpos,
-            )
-        else:
-            anntotate_entyvio(
-                ax3,
-                date,
-                y=16,
-                label=f"{msg}",
-            )
 
-    y_ticks = [0, 5, 10, 15, 20]
-    y_ticks_labels = [str(x) for x in y_ticks]
-    y_ticks_lim = (0, 20)
-    y_label = "Aantal"
+class OccurrencesFigure:
+    """
+    A long-lived figure for the occurrences plot of one view of a YAML file.
 
-    ax3.set_ylabel(y_label)
-    ax3.set_ylim(*y_ticks_lim)
-    ax3.yaxis.set_major_locator(FixedLocator(y_ticks))
-    ax3.yaxis.set_major_formatter(FixedFormatter(y_ticks_labels))
-    ax3.yaxis.set_minor_locator(FixedLocator(range(y_ticks_lim[1])))
+    The figure, the axes, and all the static decorations (annotations, night bands, ticks)
+    are created once. A new render only updates the data of the scatter and line artists
+    and the x-axis limits before saving the figure.
+    """
 
-    # Remove ticks from the bottom x-axis
-    ax3.tick_params(axis="x", which="both", bottom=False, top=False, length=0, labelbottom=False)
+    def __init__(self, config: OccurrencesConfig, view: View = View()):
+        import matplotlib.dates as mdates
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        from matplotlib.ticker import FixedLocator, FixedFormatter
+        import numpy as np
 
-    ax3.grid(True)
+        self.config = config
+        self.view = view
+        self.lock = threading.Lock()
 
-    ax4 = ax3.twinx()
+        # Don't use pyplot here, its global state makes it unsafe to create plots concurrently.
+        # The Agg canvas is attached explicitly, so no GUI backend is ever probed or loaded.
+        self.fig = fig = Figure(figsize=(12, 8))
+        FigureCanvasAgg(fig)
+        self.ax3, self.ax1 = ax3, ax1 = fig.subplots(2, 1, gridspec_kw={"height_ratios": [4, 4]}, sharex=True)
 
-    format_seondary_yaxis(
-        ax4,
-        yticks=y_ticks,
-        yticks_lim=y_ticks_lim,
-        ytick_labels=y_ticks_labels,
-        ylabel=y_label,
-    )
+        fig.suptitle(config.fig_title + view.title, fontsize=16)
+
+        (self.counts_line,) = ax3.plot(
+            [],
+            [],
+            color="blue",
+            alpha=0.2,
+            linestyle="-",
+            marker=".",
+            markersize=7,
+            label="Counts",
+        )
 
-    NO_COLOR = True
+        # For a weekly or monthly view, the mean per day in each period is drawn as steps.
+        if view.resolution == "day":
+            mean_label = f"Running mean (w={WINDOW_DAYS})"
+        else:
+            mean_label = f"{view.resolution.capitalize()}ly mean"
 
-    if NO_COLOR:
-        ax1.scatter(df["date_numeric"], df["time_numeric"], color="blue", s=5)
-    else:
-        # Plot blue points (normal times)
-        blue_mask = ~df["is_red"] & ~df["is_black"]
-        ax1.scatter(
-            df.loc[blue_mask, "date_numeric"],
-            df.loc[blue_mask, "time_numeric"],
+        (self.rolling_mean_line,) = ax3.plot(
+            [],
+            [],
             color="blue",
-            label="Normal",
-            s=5,
+            linestyle="-",
+            drawstyle="default" if view.resolution == "day" else "steps-post",
+            # marker="o",
+            # markersize=5,
+            label=mean_label,
         )
 
-        # Plot red points
-        red_mask = df["is_red"]
-        ax1.scatter(
-            df.loc[red_mask, "date_numeric"],
-            df.loc[red_mask, "time_numeric"],
-            color="red",
-            label="Special",
-            s=5,
+        ax3.text(
+            0.10,
+            0.90,
+            mean_label,
+            transform=ax3.transAxes,
+            verticalalignment="top",
+            bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.8),
         )
 
-        # Plot black points
-        black_mask = df["is_black"]
-        ax1.scatter(
-            df.loc[black_mask, "date_numeric"],
-            df.loc[black_mask, "time_numeric"],
-            color="black",
-            label="Special",
-            s=5,
+        # The annotations from the YAML file are drawn in update(), only when they are in the plotted date range.
+        self.annotation_artists: dict[Annotation, list] = {}
+
+        y_ticks = [0, 5, 10, 15, 20]
+        y_ticks_labels = [str(x) for x in y_ticks]
+        y_ticks_lim = (0, 20)
+        y_label = "Aantal"
+
+        ax3.set_ylabel(y_label)
+        ax3.set_ylim(*y_ticks_lim)
+        ax3.yaxis.set_major_locator(FixedLocator(y_ticks))
+        ax3.yaxis.set_major_formatter(FixedFormatter(y_ticks_labels))
+        ax3.yaxis.set_minor_locator(FixedLocator(range(y_ticks_lim[1])))
+
+        # Remove ticks from the bottom x-axis
+        ax3.tick_params(axis="x", which="both", bottom=False, top=False, length=0, labelbottom=False)
+
+        ax3.grid(True)
+
+        ax4 = ax3.twinx()
+
+        format_seondary_yaxis(
+            ax4,
+            yticks=y_ticks,
+            yticks_lim=y_ticks_lim,
+            ytick_labels=y_ticks_labels,
+            ylabel=y_label,
         )
 
-    ax1.set_xlabel("Date")
-    ax1.set_ylabel("Time (hour)")
-    ax1.grid(True)
-    # ax1.yaxis.grid(which='minor', color='whitesmoke', linestyle='-', linewidth=1)
+        if NO_COLOR:
+            self.scatters = {"all": ax1.scatter([], [], color="blue", s=5)}
+        else:
+            self.scatters = {
+                "normal": ax1.scatter([], [], color="blue", label="Normal", s=5),
+                "red": ax1.scatter([], [], color="red", label="Special", s=5),
+                "black": ax1.scatter([], [], color="black", label="Special", s=5),
+            }
+
+        # The density image is only shown in density mode, empty bins are transparent.
+        self.density = ax1.imshow(
+            np.ma.masked_all((1, 1)),
+            extent=(0, 1, 0, 24),
+            origin="lower",
+            aspect="auto",
+            interpolation="nearest",
+            cmap="Blues",
+            visible=False,
+        )
+
+        ax1.set_xlabel("Date")
+        ax1.set_ylabel("Time (hour)")
+        ax1.grid(True)
+        # ax1.yaxis.grid(which='minor', color='whitesmoke', linestyle='-', linewidth=1)
 
-    # Define the ticks on the bottom x-axis
+        # Define the ticks on the bottom x-axis
 
-    # 1. Set fixed x-axis ticks each day (this gets very crowded with many days)
+        # 1. Set fixed x-axis ticks each day (this gets very crowded with many days)
 
-    # ax1.xaxis.set_major_locator(FixedLocator(fixed_locations))
-    # ax1.xaxis.set_major_formatter(FixedFormatter(fixed_labels))
+        # ax1.xaxis.set_major_locator(FixedLocator(fixed_locations))
+        # ax1.xaxis.set_major_formatter(FixedFormatter(fixed_labels))
 
-    # 2. Use AutoDateLocator and ConciseDateFormatter for the x-axis with a maximum of 20 ticks
+        # 2. Use AutoDateLocator and ConciseDateFormatter for the x-axis with a maximum of 20 ticks
 
-    locator = mdates.AutoDateLocator(minticks=5, maxticks=20)
-    formatter = mdates.ConciseDateFormatter(locator)
-    ax1.xaxis.set_major_locator(locator)
-    ax1.xaxis.set_major_formatter(formatter)
+        locator = mdates.AutoDateLocator(minticks=5, maxticks=20)
+        formatter = mdates.ConciseDateFormatter(locator)
+        ax1.xaxis.set_major_locator(locator)
+        ax1.xaxis.set_major_formatter(formatter)
 
-    # Add darker background for the 'night' part (e.g., from 22:00 to 08:00)
-    night_start = 22  # 22:00 in the evening
-    night_end = 8  # 08:00 in the morning
+        # Add darker background for the 'night' part (e.g., from 22:00 to 08:00)
+        night_start = 22  # 22:00 in the evening
+        night_end = 8  # 08:00 in the morning
 
-    ax1.axhspan(night_start, 24, facecolor="gray", alpha=0.3)  # Night from 18:00 to midnight
-    ax1.axhspan(0, night_end, facecolor="gray", alpha=0.3)  # Night from midnight to 06:00
+        ax1.axhspan(night_start, 24, facecolor="gray", alpha=0.3)  # Night from 18:00 to midnight
+        ax1.axhspan(0, night_end, facecolor="gray", alpha=0.3)  # Night from midnight to 06:00
 
-    # Set fixed y-axis ticks at [0, 8, 12, 18, 22, 24] hours
-    y_ticks_lim = (0, 24)
-    y_ticks = [0, 4, 8, 12, 16, 20, 24]
-    y_tick_labels = [str(x) for x in y_ticks]
-    # plt.yticks(y_ticks, y_tick_labels)
+        # Set fixed y-axis ticks at [0, 8, 12, 18, 22, 24] hours
+        y_ticks_lim = (0, 24)
+        y_ticks = [0, 4, 8, 12, 16, 20, 24]
+        y_tick_labels = [str(x) for x in y_ticks]
+        # plt.yticks(y_ticks, y_tick_labels)
 
-    # Set y-axis limits from 0 to 24 hours
-    ax1.set_ylim(*y_ticks_lim)
+        # Set y-axis limits from 0 to 24 hours
+        ax1.set_ylim(*y_ticks_lim)
 
-    ax1.yaxis.set_major_locator(FixedLocator(y_ticks))
-    ax1.yaxis.set_major_formatter(FixedFormatter(y_tick_labels))
+        ax1.yaxis.set_major_locator(FixedLocator(y_ticks))
+        ax1.yaxis.set_major_formatter(FixedFormatter(y_tick_labels))
 
-    ax1.yaxis.set_minor_locator(FixedLocator(range(24)))
+        ax1.yaxis.set_minor_locator(FixedLocator(range(24)))
+
+        # Create a secondary y-axis that shares the same x-axis
+        ax2 = ax1.twinx()
+
+        format_seondary_yaxis(
+            ax2,
+            yticks=y_ticks,
+            yticks_lim=y_ticks_lim,
+            ytick_labels=y_tick_labels,
+            ylabel="Time (hour)",
+        )
 
-    # Create a secondary y-axis that shares the same x-axis
-    ax2 = ax1.twinx()
+        # The layout is calculated when the first data is plotted, see update().
+        self.layout_done = False
 
-    format_seondary_yaxis(
-        ax2,
-        yticks=y_ticks,
-        yticks_lim=y_ticks_lim,
-        ytick_labels=y_tick_labels,
-        ylabel="Time (hour)",
+    def update(self, df: pd.DataFrame, occurrences_per_day: DailyCounts | None = None):
+        """
+        Update the artists with the data from the DataFrame with the parsed occurrences.
+        The occurrences shall be sorted on date, see select_view().
+        """
+        import matplotlib.dates as mdates
+
+        ax3, ax1 = self.ax3, self.ax1
+
+        # Total occurrences per day, maintained incrementally when the file is modified
+        if occurrences_per_day is None:
+            occurrences_per_day = daily_counts(self.config.yaml_file, df, self.config.store)
+
+        data = select_view(self.view, df, occurrences_per_day)
+        df, counts = data.df, data.counts
+
+        # FixedFomatter shall be used with FixedLocator, the locations shall be in the units of the axis, i.e. numeric datetime.
+        fixed_locations = mdates.date2num(data.dates)
+
+        self.counts_line.set_data(fixed_locations, counts)
+        self.rolling_mean_line.set_data(mdates.date2num(data.mean_dates), data.mean)
+
+        if self.config.use_density(len(df)):
+            self.update_density(df)
+        else:
+            self.update_scatter(df)
+
+        # Autoscaling doesn't take collections into account after they are updated, so the
+        # x-axis limits are set explicitly, with the same 5% margin as the default autoscale.
+
+        if len(fixed_locations):
+            xmin, xmax = fixed_locations[0], fixed_locations[-1]
+            margin = 0.05 * (xmax - xmin) if xmax > xmin else 1.0
+            ax1.set_xlim(xmin - margin, xmax + margin)
+
+        self.update_annotations()
+
+        if not self.layout_done:
+            self.fig.tight_layout(rect=(0, 0, 1, 1))
+            self.layout_done = True
+
+        if not "do we need a top axis?":
+            # Add a second x-axis at the top with the occurrence per day as major ticks
+            ax2 = ax3.twiny()
+            ax2.set_xlim(ax3.get_xlim())
+            ax2.set_xticks(fixed_locations)
+            ax2.set_xticklabels(counts)
+
+            # Set font size for the major ticks
+            ax2.tick_params(axis="x", which="major", labelsize=10)
+
+            # An alternative way to set the fontsize for each major tick label individually.
+            #
+            # for tick in ax2.xaxis.get_major_ticks():
+            #     # specify integer or one of preset strings, e.g. small, x-small, ...
+            #     tick.label2.set_fontsize(10)
+            #     # tick.label2.set_fontsize("small")
+            #     tick.label2.set_rotation("horizontal")
+
+            ax2.set_xlabel(self.config.top_axis_label)
+
+    def update_annotations(self):
+        """Draw the annotations that overlap with the plotted date range, and hide the others."""
+        import matplotlib.dates as mdates
+
+        xmin, xmax = self.ax1.get_xlim()
+        visible = self.config.annotations.overlapping(mdates.num2date(xmin).date(), mdates.num2date(xmax).date())
+
+        for annotation in visible:
+            if annotation not in self.annotation_artists:
+                self.annotation_artists[annotation] = draw_annotation(self.ax3, annotation)
+
+        for annotation, artists in self.annotation_artists.items():
+            for artist in artists:
+                artist.set_visible(annotation in visible)
+
+    def update_scatter(self, df: pd.DataFrame):
+        import numpy as np
+
+        points = np.column_stack([df["date_numeric"].to_numpy(), df["time_numeric"].to_numpy()])
+
+        if NO_COLOR:
+            self.scatters["all"].set_offsets(points)
+        else:
+            is_red = df["is_red"].to_numpy()
+            is_black = df["is_black"].to_numpy()
+            self.scatters["normal"].set_offsets(points[~is_red & ~is_black])
+            self.scatters["red"].set_offsets(points[is_red])
+            self.scatters["black"].set_offsets(points[is_black])
+
+        for scatter in self.scatters.values():
+            scatter.set_visible(True)
+        self.density.set_visible(False)
+
+    def update_density(self, df: pd.DataFrame):
+        import numpy as np
+
+        if df.empty:
+            return
+
+        counts, date_edges = occurrence_density(df["date_numeric"].to_numpy(), df["time_numeric"].to_numpy())
+
+        self.density.set_data(np.ma.masked_equal(counts, 0))
+        self.density.set_extent((date_edges[0], date_edges[-1], 0, 24))
+        self.density.set_clim(1, max(counts.max(), 1))
+
+        for scatter in self.scatters.values():
+            scatter.set_visible(False)
+        self.density.set_visible(True)
+
+    def save(self, path: Path):
+        self.fig.savefig(path)
+
+
+# The figure template for each view of a YAML file, it is re-used for every render of that view.
+
+_FIGURES: dict[tuple[Path, View], OccurrencesFigure] = {}
+
+
+def get_figure(config: OccurrencesConfig, view: View = View()) -> OccurrencesFigure:
+    """Returns the figure template for the configuration, a new one is created when the configuration changed."""
+    key = (config.yaml_file.resolve(), view)
+    figure = _FIGURES.get(key)
+
+    if figure is None or figure.config != config:
+        figure = _FIGURES[key] = OccurrencesFigure(config, view)
+
+    return figure
+
+
+def export_figure(
+    timestamp, config: OccurrencesConfig, df: pd.DataFrame, occurrences_per_day: DailyCounts, fmt: str, timer: StageTimer
+):
+    """Save the matplotlib figure for each view of the YAML file, the format is 'png' or 'svg'."""
+    for view in config.views:
+        with timer.stage(f"{fmt} figure"):
+            figure = get_figure(config, view)
+        path = config.output_for(view, fmt)
+
+        with figure.lock:
+            with timer.stage(f"{fmt} update"):
+                figure.update(df, occurrences_per_day)
+
+            rich.print(f"{timestamp} Creating occurrences plot at {path}")
+            with timer.stage(f"{fmt} save"):
+                figure.save(path)
+
+
+def bokeh_layout(config: OccurrencesConfig, view: View, data: ViewData):
+    """Returns the interactive counterpart of the occurrences figure, with a shared date axis for both panels."""
+    import numpy as np
+    from bokeh.layouts import column
+    from bokeh.models import BoxAnnotation, ColumnDataSource, HoverTool, Label, LinearColorMapper, Span
+    from bokeh.palettes import Blues256
+    from bokeh.plotting import figure
+
+    df = data.df
+    tools = "xpan,xwheel_zoom,box_zoom,reset,save"
+
+    counts = figure(
+        title=config.fig_title + view.title,
+        x_axis_type="datetime",
+        y_axis_label="Aantal",
+        y_range=(0, 20),
+        width=1200,
+        height=350,
+        tools=tools,
+    )
+    counts.line(data.dates, data.counts, color="blue", alpha=0.2)
+    counts.scatter(data.dates, data.counts, color="blue", alpha=0.2, size=5)
+
+    if view.resolution == "day":
+        counts.line(data.mean_dates, data.mean, color="blue", legend_label=f"Running mean (w={WINDOW_DAYS})")
+    else:
+        counts.step(data.mean_dates, data.mean, color="blue", mode="after", legend_label=f"{view.resolution.capitalize()}ly mean")
+    counts.legend.location = "top_left"
+
+    if len(data.dates):
+        first, last = data.dates[[0, -1]].astype(datetime.date)
+        for annotation in config.annotations.overlapping(first, last):
+            for date, label, y in (
+                (annotation.start, annotation.label, annotation.y),
+                (annotation.end, annotation.end_label, annotation.end_y),
+            ):
+                if date is None:
+                    continue
+                location = np.datetime64(date, "ms").astype(np.int64)
+                counts.add_layout(Span(location=location, dimension="height", line_color="gray", line_dash="dashed"))
+                counts.add_layout(Label(x=location, y=y or 16, text=label, text_font_size="9pt"))
+
+    occurrences = figure(
+        x_axis_type="datetime",
+        x_range=counts.x_range,
+        x_axis_label="Date",
+        y_axis_label="Time (hour)",
+        y_range=(0, 24),
+        width=1200,
+        height=350,
+        tools=tools,
     )
+    occurrences.add_layout(BoxAnnotation(bottom=22, top=24, fill_color="gray", fill_alpha=0.3))
+    occurrences.add_layout(BoxAnnotation(bottom=0, top=8, fill_color="gray", fill_alpha=0.3))
+
+    if len(df) and config.use_density(len(df)):
+        # The density is binned on days since the epoch, Bokeh expects milliseconds since the epoch
+        days = df["date"].to_numpy().astype("datetime64[D]").astype(np.float64)
+        density, date_edges = occurrence_density(days, df["time_numeric"].to_numpy())
+        mapper = LinearColorMapper(palette=Blues256[::-1], low=1, high=max(density.max(), 1), nan_color=(0, 0, 0, 0))
+        occurrences.image(
+            image=[np.where(density > 0, density, np.nan)],
+            x=date_edges[0] * 86_400_000,
+            y=0,
+            dw=(date_edges[-1] - date_edges[0]) * 86_400_000,
+            dh=24,
+            color_mapper=mapper,
+        )
+    else:
+        # The tooltip text is formatted from time_numeric, the cache doesn't keep the time strings
+        hours = df["time_numeric"].to_numpy()
+        times = format_minutes(np.rint(hours * 60).astype(np.int64))
+        source = ColumnDataSource({"date": df["date"].to_numpy(), "hour": hours, "time": times})
+        renderer = occurrences.scatter("date", "hour", source=source, color="blue", size=3)
+        occurrences.add_tools(
+            HoverTool(renderers=[renderer], tooltips=[("date", "@date{%F}"), ("time", "@time")], formatters={"@date": "datetime"})
+        )
+
+    return column(counts, occurrences)
+
+
+def export_html(
+    timestamp, config: OccurrencesConfig, df: pd.DataFrame, occurrences_per_day: DailyCounts, fmt: str, timer: StageTimer
+):
+    """Save an interactive Bokeh plot for each view of the YAML file."""
+    from bokeh.embed import file_html
+    from bokeh.resources import CDN
+
+    for view in config.views:
+        path = config.output_for(view, fmt)
+        with timer.stage(f"{fmt} update"):
+            layout = bokeh_layout(config, view, select_view(view, df, occurrences_per_day))
+
+        rich.print(f"{timestamp} Creating occurrences plot at {path}")
+        with timer.stage(f"{fmt} save"):
+            path.write_text(file_html(layout, CDN, config.fig_title + view.title))
+
+
+EXPORTERS = {"png": export_figure, "svg": export_figure, "html": export_html}
+
+
+def export(
+    fmt: str, timestamp, config: OccurrencesConfig, df: pd.DataFrame, occurrences_per_day: DailyCounts
+) -> dict[str, float]:
+    """
+    Export all views of the YAML file in the given format, this function is executed in an
+    export worker process or in the render worker of the daemon. Returns the time of the
+    export stages.
+    """
+    timer = StageTimer()
+    EXPORTERS[fmt](timestamp, config, df, occurrences_per_day, fmt, timer)
+
+    return timer.stages
+
+
+# The export workers are started on the first render with more than one format, and are
+# re-used for later renders, so the figure templates in the workers are re-used as well.
+
+_EXPORT_POOL: ProcessPoolExecutor | None = None
+
+
+def get_export_pool() -> ProcessPoolExecutor:
+    global _EXPORT_POOL
 
-    if not "do we need a top axis?":
-        # Add a second x-axis at the top with the occurrence per day as major ticks
-        ax2 = ax3.twiny()
-        ax2.set_xlim(ax3.get_xlim())
-        ax2.set_xticks(fixed_locations)
-        ax2.set_xticklabels(occurrences_per_day.values)
+    if _EXPORT_POOL is None:
+        max_workers = min(len(EXPORT_FORMATS), os.cpu_count() or 1)
+        _EXPORT_POOL = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn"))
 
-        # Set font size for the major ticks
-        ax2.tick_params(axis="x", which="major", labelsize=10)
+    return _EXPORT_POOL
 
-        # An alternative way to set the fontsize for each major tick label individually.
-        #
-        # for tick in ax2.xaxis.get_major_ticks():
-        #     # specify integer or one of preset strings, e.g. small, x-small, ...
-        #     tick.label2.set_fontsize(10)
-        #     # tick.label2.set_fontsize("small")
-        #     tick.label2.set_rotation("horizontal")
 
-        ax2.set_xlabel(TOP_AXIS_LABEL)
+def aggregate(config: OccurrencesConfig, df: pd.DataFrame) -> DailyCounts:
+    """Adds the numeric dates to the occurrences, returns the number of occurrences per day."""
+    import matplotlib.dates as mdates
+
+    # Convert datetime objects to numerical values
+    df["date_numeric"] = mdates.date2num(df["date"])
+
+    return daily_counts(config.yaml_file, df, config.store)
+
+
+def create_plot(
+    timestamp, yaml_file, use_cache: bool = True, timer: StageTimer | None = None, concurrent: bool = True
+) -> OccurrencesConfig | None:
+    """
+    Create the plots for all views and formats of the YAML file from one parse of the file.
+    Returns the configuration or None when the file could not be read.
+
+    When more than one format is requested and concurrent is True, large plots are exported
+    concurrently in worker processes, so a render takes about as long as the slowest format,
+    see EXPORT_POOL_THRESHOLD. Use concurrent=False when this function is already running in
+    a worker process, the formats are then exported one after the other in that process.
+
+    The time of each stage is added to the timer when it is given.
+    """
+    from ruamel.yaml.scanner import ScannerError
+
+    timer = timer or StageTimer()
+
+    try:
+        config, df = load_data(yaml_file, use_cache=use_cache, timer=timer)
+    except ScannerError:
+        rich.print(f"[red]ERROR: Error while scanning {yaml_file}[/]")
+        return None
+
+    with timer.stage("aggregate"):
+        occurrences_per_day = aggregate(config, df)
 
-    plt.tight_layout(rect=(0, 0, 1, 1))
+    concurrent = (
+        concurrent
+        and len(config.formats) > 1
+        and (os.cpu_count() or 1) > 1
+        and len(df) >= EXPORT_POOL_THRESHOLD
+    )
 
-    rich.print(f"{timestamp} Creating occurrences plot at {PNG_PATH / PNG_FILE}")
-    plt.savefig(PNG_PATH / PNG_FILE)
+    with timer.stage("export"):
+        if not concurrent:
+            for fmt in config.formats:
+                timer.update(export(fmt, timestamp, config, df, occurrences_per_day))
+        else:
+            pool = get_export_pool()
+            futures = [pool.submit(export, fmt, timestamp, config, df, occurrences_per_day) for fmt in config.formats]
+            # Wait for all exports, the first error is raised
+            for future in futures:
+                timer.update(future.result())
 
-    plt.close()
+    return config
 
 
 class MyEventHandler(FileSystemEventHandler):
-    def __init__(self, trigger: queue.Queue, yaml_file: Path):
+    """
+    Schedules a render when the watched file changes.
+
+    All events that arrive within `delay` seconds of each other are coalesced, and the
+    render is triggered once, `delay` seconds after the last event (trailing edge).
+    Besides modifications, also moved (atomic rename) and created events for the
+    watched file trigger a render, since editors often save a file that way.
+    Changes to the other files, e.g. the store with the occurrences, also trigger a
+    render of the YAML file.
+    """
+
+    def __init__(
+        self, trigger: queue.Queue, yaml_file: Path, delay: float = DEBOUNCE_DELAY, other_files: tuple[Path, ...] = ()
+    ):
         self.last_occurrence = time.time()
         self.trigger = trigger
-        self.watch_file = yaml_file.name
+        self.yaml_file = yaml_file
+        self.watch_files = {yaml_file.name, *(x.name for x in other_files)}
+        self.delay = delay
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+        # The number of events that were coalesced into a later trigger
+        self.skipped = 0
+
+    def _is_watch_file(self, path) -> bool:
+        return Path(os.fsdecode(path)).name in self.watch_files
 
     def on_any_event(self, event: FileSystemEvent) -> None:
-        if isinstance(event, FileModifiedEvent):
-            # rich.print(f"{event.src_path = }, {self.watch_file = }")
-            if str(event.src_path).endswith(self.watch_file):
-                if time.time() - self.last_occurrence > 5.0:
-                    self.last_occurrence = time.time()
-                    # rich.print(datetime.datetime.fromtimestamp(self.last_occurrence), event)
-                    self.trigger.put(
-                        (
-                            datetime.datetime.fromtimestamp(self.last_occurrence),
-                            event.src_path,
-                        )
-                    )
+        if isinstance(event, (FileModifiedEvent, FileCreatedEvent)):
+            matches = self._is_watch_file(event.src_path)
+        elif isinstance(event, FileMovedEvent):
+            matches = self._is_watch_file(event.dest_path)
+        else:
+            matches = False
+
+        if matches:
+            with self._lock:
+                self.last_occurrence = time.time()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self.skipped += 1
+                self._timer = threading.Timer(self.delay, self._fire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            last_occurrence = self.last_occurrence
+
+        # The queue is unbounded, the RenderPool keeps at most one pending render per file
+        # and replaces it with the latest trigger.
+
+        self.trigger.put((datetime.datetime.fromtimestamp(last_occurrence), self.yaml_file))
+
+    def cancel(self):
+        """Cancel a pending trigger, e.g. when the observer is stopped."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+def render_plot(
+    timestamp, yaml_file: Path, use_cache: bool = True
+) -> tuple[OccurrencesConfig | None, dict[str, float]]:
+    """
+    Create the plot for the given YAML file, this function is executed in a worker process.
+    The render workers are the parallelism of the daemon, the formats are exported in the
+    worker itself, no export pool is started.
+
+    Returns the configuration of the YAML file, or None when the YAML file could not be read,
+    and the time of the stages of the render.
+    """
+    timer = StageTimer()
+
+    with timer.stage("total"):
+        config = create_plot(timestamp, yaml_file, use_cache=use_cache, timer=timer, concurrent=False)
+
+    return config, timer.stages
+
+
+class RenderPool:
+    """
+    Renders the plots in a pool of worker processes.
+
+    Each YAML file has at most one render running and one render pending. A trigger for a
+    file that is being rendered is remembered and submitted when the running render finishes,
+    so a slow render of one file never blocks the renders of the other files.
+
+    Each YAML file is always rendered by the same worker process, since the ingest state,
+    the figure templates, and the daily counts of a file are kept in the worker. The files
+    are assigned to the workers in turn, when there are more files than workers, a worker
+    renders several files.
+
+    When a worker process dies, e.g. killed by the OOM killer, a new worker is started for
+    its files and the interrupted renders are submitted once more.
+    """
+
+    def __init__(self, max_workers: int, use_cache: bool = True):
+        self.max_workers = max_workers
+        # One single-worker executor per slot, started when the first file is assigned to it
+        self.executors: list[ProcessPoolExecutor | None] = [None] * max_workers
+        self.slots: dict[Path, int] = {}
+        self.use_cache = use_cache
+        self.running: dict[Path, Future] = {}
+        self.pending: dict[Path, datetime.datetime] = {}
+        # The number of triggers that were replaced by a later trigger while pending
+        self.skipped = 0
+        # The files whose render was interrupted by a dead worker and submitted again
+        self.retried: set[Path] = set()
+
+    def submit(self, timestamp, yaml_file: Path) -> Future | None:
+        if yaml_file in self.running:
+            if yaml_file in self.pending:
+                self.skipped += 1
+            self.pending[yaml_file] = timestamp
+            return None
+
+        try:
+            future = self.executor_for(yaml_file).submit(render_plot, timestamp, yaml_file, self.use_cache)
+        except BrokenProcessPool:
+            self.restart(yaml_file)
+            future = self.executor_for(yaml_file).submit(render_plot, timestamp, yaml_file, self.use_cache)
+
+        self.running[yaml_file] = future
+
+        return future
+
+    def executor_for(self, yaml_file: Path) -> ProcessPoolExecutor:
+        """Returns the executor of the worker process that renders the YAML file."""
+        slot = self.slots.setdefault(yaml_file, len(self.slots) % self.max_workers)
+
+        if self.executors[slot] is None:
+            # Use 'spawn' since the watchdog observer threads are running in the main process
+            self.executors[slot] = ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"))
+
+        return self.executors[slot]
+
+    def restart(self, yaml_file: Path):
+        """Drop the broken executor of the YAML file, a new worker is started on the next submit."""
+        slot = self.slots[yaml_file]
+        rich.print(f"[red]The worker process for {yaml_file} died, starting a new worker.[/]")
+
+        self.executors[slot].shutdown(wait=False, cancel_futures=True)
+        self.executors[slot] = None
+
+    def poll(self) -> list[tuple[Path, Future]]:
+        """Returns the renders that finished since the last poll and submits the pending renders."""
+        done = [(yaml_file, future) for yaml_file, future in self.running.items() if future.done()]
+        finished = []
+
+        for yaml_file, future in done:
+            del self.running[yaml_file]
+
+            # The worker died during the render, submit the render once more on a new worker
+            if isinstance(future.exception(), BrokenProcessPool) and yaml_file not in self.retried:
+                self.retried.add(yaml_file)
+                self.submit(self.pending.pop(yaml_file, datetime.datetime.now()), yaml_file)
+                continue
+
+            self.retried.discard(yaml_file)
+            finished.append((yaml_file, future))
+
+            if yaml_file in self.pending:
+                self.submit(self.pending.pop(yaml_file), yaml_file)
+
+        return finished
+
+    def shutdown(self):
+        for executor in self.executors:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+
+class RenderStats:
+    """
+    The render counters of the daemon, and a rolling summary of the stage timings of the
+    last renders. The summary is printed as a table and can be written to a JSON file.
+    """
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self.started = datetime.datetime.now()
+        self.renders = 0
+        self.errors = 0
+        self.skipped = 0
+        self.timings: collections.deque[dict[str, float]] = collections.deque(maxlen=window)
+
+    def record(self, stages: dict[str, float]):
+        self.renders += 1
+        self.timings.append(stages)
+
+    def record_error(self):
+        self.errors += 1
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Returns the count, mean, 95th percentile, maximum, and last time in seconds for each stage."""
+        import numpy as np
+
+        # The stages are kept in the order they were first seen
+        names = dict.fromkeys(name for stages in self.timings for name in stages)
+        summary = {}
+
+        for name in names:
+            values = np.array([stages[name] for stages in self.timings if name in stages])
+            summary[name] = {
+                "count": len(values),
+                "mean": float(values.mean()),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(values.max()),
+                "last": float(values[-1]),
+            }
+
+        return summary
+
+    def as_dict(self) -> dict:
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+            "renders": self.renders,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "stages": self.summary(),
+        }
+
+    def table(self):
+        from rich.table import Table
+
+        table = Table(
+            title=f"Renders: {self.renders}, errors: {self.errors}, skipped events: {self.skipped}",
+            caption=f"Stage timings of the last {len(self.timings)} renders",
+        )
+        table.add_column("Stage")
+        for column in ("Count", "Mean (ms)", "P95 (ms)", "Max (ms)", "Last (ms)"):
+            table.add_column(column, justify="right")
+
+        for name, stats in self.summary().items():
+            table.add_row(
+                name,
+                str(stats["count"]),
+                *(f"{stats[x] * 1000:.1f}" for x in ("mean", "p95", "max", "last")),
+            )
+
+        return table
+
+    def write(self, path: Path):
+        """Write the counters and the summary to a JSON file, the file is replaced atomically."""
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.as_dict(), indent=4))
+        os.replace(tmp_path, path)
+
+
+def expand_yaml_files(paths: list[str]) -> list[Path]:
+    """Expand directories and glob patterns into the list of YAML files, duplicates are removed."""
+    yaml_files = []
+
+    for path in paths:
+        path = Path(path).expanduser()
+        if path.is_dir():
+            yaml_files.extend(sorted([*path.glob("*.yaml"), *path.glob("*.yml")]))
+        elif glob.has_magic(str(path)):
+            yaml_files.extend(sorted(Path(x) for x in glob.glob(str(path))))
+        else:
+            yaml_files.append(path)
+
+    return list({yaml_file.resolve(): None for yaml_file in yaml_files})
+
+
+def use_headless_backend():
+    """
+    Pin the non-interactive Agg backend for matplotlib.
+
+    The environment variable is inherited by the worker processes, and makes sure that
+    matplotlib never probes for a GUI toolkit, e.g. when running from cron or a hook.
+    """
+    os.environ["MPLBACKEND"] = "Agg"
 
 
 app = typer.Typer()
 
 
 @app.command()
-def main(yaml_file: str):
+def render(
+    yaml_files: Annotated[list[str], typer.Argument(help="YAML files, directories, or glob patterns to plot.")],
+    no_cache: Annotated[bool, typer.Option("--no-cache", help="Always parse the YAML file, don't use the cache.")] = False,
+    timings: Annotated[bool, typer.Option("--timings", help="Print the time of each stage of the renders.")] = False,
+):
+    """Create the plots once and exit, the YAML files are not watched."""
+    use_headless_backend()
+
+    yaml_file_paths = expand_yaml_files(yaml_files)
+
+    if not yaml_file_paths:
+        rich.print(f"[red]ERROR: No YAML files found in {yaml_files}[/]")
+        raise typer.Exit(code=1)
+
+    now = datetime.datetime.now()
+    stats = RenderStats()
+    results = []
+
+    for yaml_file in yaml_file_paths:
+        timer = StageTimer()
+        with timer.stage("total"):
+            results.append(config := create_plot(now, yaml_file, use_cache=not no_cache, timer=timer))
+        if config:
+            stats.record(timer.stages)
+        else:
+            stats.record_error()
+
+    if timings:
+        rich.print(stats.table())
+
+    if not all(results):
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def import_yaml_data(
+    yaml_file: Annotated[Path, typer.Argument(help="YAML file with the occurrences in its data section.")],
+    store: Annotated[Path | None, typer.Argument(help="The store, default is the YAML file with the .occlog suffix.")] = None,
+):
+    """Write the occurrences from the YAML file to a store, an existing store is replaced."""
+    from metrics.generic.occurrences_store import STORE_SUFFIX
+    from metrics.generic.occurrences_store import import_yaml
+
+    store = store or yaml_file.with_suffix(STORE_SUFFIX)
+    count = import_yaml(yaml_file, store)
+
+    rich.print(f"Imported {count} occurrences from {yaml_file} into {store}")
+    rich.print(f"Add 'store: {store.name}' to {yaml_file.name} to use the store.")
+
+
+@app.command()
+def export_yaml_data(
+    store: Annotated[Path, typer.Argument(help="The store with the occurrences.")],
+    yaml_file: Annotated[Path, typer.Argument(help="YAML file, the data section is replaced, the rest is kept.")],
+):
+    """Write the occurrences from the store as the data section of the YAML file."""
+    from metrics.generic.occurrences_store import export_yaml
+
+    count = export_yaml(store, yaml_file)
+
+    rich.print(f"Exported {count} occurrences from {store} into {yaml_file}")
+
+
+@app.command()
+def append(
+    yaml_file: Annotated[Path, typer.Argument(help="YAML file that configures a store.")],
+    times: Annotated[list[str] | None, typer.Argument(help="Times 'HH:MM' with optional R, Z, or D suffix, default is now.")] = None,
+    date: Annotated[str | None, typer.Option(help="The date 'YYYY-MM-DD' of the occurrences, default is today.")] = None,
+):
+    """Append occurrences to the store of the YAML file."""
+    from metrics.generic.occurrences_store import append_occurrences
+    from metrics.generic.occurrences_store import encode_occurrences
+
+    config = OccurrencesConfig.from_yaml(yaml_file, load_yaml(yaml_file.read_bytes()))
+
+    if config.store is None:
+        rich.print(f"[red]ERROR: No store configured in {yaml_file}, add 'store: <path>' to the file.[/]")
+        raise typer.Exit(code=1)
+
+    now = datetime.datetime.now()
+    date = date or now.date().isoformat()
+    times = times or [now.strftime("%H:%M")]
+
+    append_occurrences(config.store, encode_occurrences([(date, time_str) for time_str in times]))
+
+    rich.print(f"Appended {len(times)} occurrence(s) on {date} to {config.store}")
+
+
+@app.command()
+def main(
+    yaml_files: Annotated[list[str], typer.Argument(help="YAML files, directories, or glob patterns to watch.")],
+    no_cache: Annotated[bool, typer.Option("--no-cache", help="Always parse the YAML file, don't use the cache.")] = False,
+    workers: Annotated[int, typer.Option(help="Maximum number of worker processes for rendering.")] = 0,
+    stats_interval: Annotated[
+        int, typer.Option(help="Seconds between the reports of the render timings, 0 disables the reports.")
+    ] = STATS_INTERVAL,
+    stats_file: Annotated[
+        Path | None, typer.Option(help="JSON file with the render counters and timings, written with each report.")
+    ] = None,
+    serve_port: Annotated[
+        int | None, typer.Option(help=f"Accept occurrences over HTTP on {INGEST_HOST} at this port, 0 picks a free port.")
+    ] = None,
+    flush_interval: Annotated[
+        float, typer.Option(help="Seconds between the writes of the occurrences that were posted.")
+    ] = FLUSH_INTERVAL,
+):
+    """Create the plots and re-create them each time a YAML file is modified."""
     from rich.console import Console
+    from watchdog.observers import Observer
+
+    use_headless_backend()
 
     console = Console()
 
-    # First time run, create the plot
+    yaml_file_paths = expand_yaml_files(yaml_files)
+
+    if not yaml_file_paths:
+        rich.print(f"[red]ERROR: No YAML files found in {yaml_files}[/]")
+        raise typer.Exit(code=1)
 
-    yaml_file_path = Path(yaml_file)
+    max_workers = workers or min(len(yaml_file_paths), os.cpu_count() or 1)
 
-    create_plot(datetime.datetime.now(), yaml_file_path)
+    render_pool = RenderPool(max_workers=max_workers, use_cache=not no_cache)
 
     trigger_queue = queue.Queue()
 
-    event_handler = MyEventHandler(yaml_file=yaml_file_path, trigger=trigger_queue)
     observer = Observer()
-    observer.schedule(event_handler, str(WATCH_PATH), recursive=False)
-    observer.start()
+    event_handlers = []
+    configs = []
+    ingest_server = None
+
+    stats = RenderStats()
+
+    def record(yaml_file: Path, future: Future) -> OccurrencesConfig | None:
+        try:
+            config, stages = future.result()
+        except Exception as exc:
+            rich.print(f"[red]Caught exception for {yaml_file}: {type(exc).__name__}, {exc}[/]")
+            console.print_exception(show_locals=True)
+            stats.record_error()
+            return None
+
+        if config is None:
+            stats.record_error()
+        else:
+            stats.record(stages)
+
+        return config
+
+    def report():
+        stats.skipped = render_pool.skipped + sum(x.skipped for x in event_handlers)
+        console.print(stats.table())
+        if stats_file:
+            stats.write(stats_file)
 
     try:
+        # First time run, create the plots. The watch path for each file is only known after its
+        # YAML file has been read, so wait for these first renders before starting the observer.
+
+        now = datetime.datetime.now()
+        first_renders = {yaml_file: render_pool.submit(now, yaml_file) for yaml_file in yaml_file_paths}
+
+        for yaml_file, future in first_renders.items():
+            config = record(yaml_file, future)
+            watch_paths = {config.watch_path if config else yaml_file.parent}
+            other_files = ()
+
+            if config:
+                configs.append(config)
+
+            if config and config.store:
+                other_files = (config.store,)
+                watch_paths.add(config.store.parent)
+
+            event_handler = MyEventHandler(yaml_file=yaml_file, trigger=trigger_queue, other_files=other_files)
+            for watch_path in watch_paths:
+                observer.schedule(event_handler, str(watch_path), recursive=False)
+            event_handlers.append(event_handler)
+
+        render_pool.poll()
+        observer.start()
+
+        if serve_port is not None:
+            from metrics.generic.occurrences_ingest import IngestServer
+
+            ingest_server = IngestServer(configs, port=serve_port, flush_interval=flush_interval)
+            ingest_server.start()
+
+        last_report = time.monotonic()
+
         while True:
             try:
-                timestamp, src_path = trigger_queue.get(timeout=1)
-                create_plot(timestamp, yaml_file_path)
+                timestamp, yaml_file = trigger_queue.get(timeout=1)
+                render_pool.submit(timestamp, yaml_file)
             except queue.Empty:
                 pass
             except KeyboardInterrupt:
@@ -585,9 +2252,28 @@ def main(yaml_file: str):
             except Exception as exc:
                 rich.print(f"[red]Caught exception: {type(exc).__name__}, {exc}[/]")
                 console.print_exception(show_locals=True)
+
+            try:
+                for yaml_file, future in render_pool.poll():
+                    record(yaml_file, future)
+            except Exception as exc:
+                rich.print(f"[red]Caught exception: {type(exc).__name__}, {exc}[/]")
+                console.print_exception(show_locals=True)
+
+            if stats_interval and time.monotonic() - last_report >= stats_interval:
+                report()
+                last_report = time.monotonic()
     finally:
-        observer.stop()
-        observer.join()
+        if ingest_server:
+            ingest_server.stop()
+        for event_handler in event_handlers:
+            event_handler.cancel()
+        if observer.is_alive():
+            observer.stop()
+            observer.join()
+        render_pool.shutdown()
+        if stats_interval:
+            report()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,282 @@
+"""
+Benchmark the occurrences pipeline on synthetic data.
+
+A YAML file with the layout of occurrences.yaml is generated for each size, with a fixed
+number of events per day and a random fraction of times with an R, Z, or D suffix. The
+random generator is seeded, so the same size always produces the same file.
+
+For each size the stages of a render are timed separately, with the same functions as the
+render command uses. The YAML file is parsed from scratch each time, i.e. no incremental
+reads and no cache:
+
+    read        load the YAML file
+    dataframe   create the DataFrame with the (date, time) rows
+    parse       convert the dates and parse the time strings with their suffix
+    aggregate   the numeric dates and the occurrences per day
+    png figure  get the figure template, it is created by the first run of each size
+    png update  update the artists of the figure with the data, incl. the rolling mean
+    png save    save the figure as PNG
+
+Each size is run several times and the median is reported, together with the time per
+event and the scaling exponent with respect to the previous size (1.0 is linear).
+The results can be saved as JSON and compared with a previous run.
+
+Usage:
+
+    $ python scatter/metrics/generic/occurrences_benchmark.py --sizes 1000 --sizes 100000 --repeat 5
+
+    $ python scatter/metrics/generic/occurrences_benchmark.py --output before.json
+    $ python scatter/metrics/generic/occurrences_benchmark.py --compare before.json
+
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Annotated
+import datetime
+import json
+import math
+import platform
+import random
+import statistics
+import tempfile
+
+import rich
+import typer
+
+from metrics.generic.occurrences import StageTimer
+from metrics.generic.occurrences import aggregate
+from metrics.generic.occurrences import export
+from metrics.generic.occurrences import load_data
+from metrics.generic.occurrences import use_headless_backend
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+EVENTS_PER_DAY = 20
+REPEAT = 3
+SEED = 42
+
+# The fraction of the times that get a suffix, the suffix is picked at random from R, Z, and D.
+
+FLAG_FRACTION = 0.05
+
+STAGES = ["read", "dataframe", "parse", "aggregate", "png figure", "png update", "png save"]
+
+FIRST_DATE = datetime.date(2000, 1, 1)
+
+
+def generate_yaml(
+    yaml_file: Path,
+    days: int,
+    events_per_day: int,
+    seed: int = SEED,
+    flag_fraction: float = FLAG_FRACTION,
+    render_mode: str = "auto",
+) -> int:
+    """
+    Write a synthetic occurrences YAML file, returns the number of events.
+
+    The number of events per day varies around events_per_day, so the days are not all the
+    same, but the total is exactly days * events_per_day.
+    """
+    rng = random.Random(seed)
+
+    # Move events between days, without changing the total
+    counts = [events_per_day] * days
+    for _ in range(days):
+        src, dst = rng.randrange(days), rng.randrange(days)
+        if counts[src] > 1:
+            counts[src] -= 1
+            counts[dst] += 1
+
+    lines = [
+        "watch_path: __here__",
+        "png_path: __here__",
+        f"png_file: {yaml_file.stem}.png",
+        f"render_mode: {render_mode}",
+        "",
+        "data:",
+    ]
+
+    for day, count in enumerate(counts):
+        minutes = sorted(rng.randrange(24 * 60) for _ in range(count))
+        times = []
+        for minute in minutes:
+            suffix = rng.choice("RZD") if rng.random() < flag_fraction else ""
+            times.append(f"'{minute // 60:02d}:{minute % 60:02d}{suffix}'")
+        lines.append(f"    '{FIRST_DATE + datetime.timedelta(days=day)}': [{', '.join(times)}]")
+
+    yaml_file.write_text("\n".join(lines) + "\n")
+
+    return sum(counts)
+
+
+def run_once(yaml_file: Path) -> dict[str, float]:
+    """Render the YAML file once as PNG, returns the time of each stage."""
+    timer = StageTimer()
+
+    config, df = load_data(yaml_file, use_cache=False, timer=timer, incremental=False)
+
+    with timer.stage("aggregate"):
+        occurrences_per_day = aggregate(config, df)
+
+    timer.update(export("png", datetime.datetime.now(), config, df, occurrences_per_day))
+
+    return timer.stages
+
+
+def scaling(results: list[dict], stage: str) -> list[float | None]:
+    """Returns the scaling exponent of the stage between each size and the previous size."""
+    exponents = [None]
+
+    for previous, current in zip(results, results[1:]):
+        t0, t1 = previous["median"][stage], current["median"][stage]
+        n0, n1 = previous["events"], current["events"]
+        exponents.append(math.log(t1 / t0) / math.log(n1 / n0) if t0 > 0 and t1 > 0 and n1 != n0 else None)
+
+    return exponents
+
+
+def print_results(results: list[dict], baseline: dict | None = None):
+    from rich.table import Table
+
+    table = Table(title="Occurrences pipeline, median time (ms) per stage")
+    table.add_column("Events", justify="right")
+    for stage in STAGES:
+        table.add_column(stage, justify="right")
+    table.add_column("total", justify="right")
+    table.add_column("µs/event", justify="right")
+
+    baseline = {x["events"]: x for x in (baseline or {}).get("results", [])}
+
+    for result in results:
+        median = result["median"]
+        total = sum(median[x] for x in STAGES)
+        cells = [f"{median[x] * 1000:.1f}" for x in STAGES] + [f"{total * 1000:.1f}", f"{total / result['events'] * 1e6:.2f}"]
+
+        # Results of an earlier version of the benchmark can have other stages
+        if (previous := baseline.get(result["events"])) and all(x in previous["median"] for x in STAGES):
+            ratios = [median[x] / previous["median"][x] for x in STAGES]
+            ratios.append(total / sum(previous["median"][x] for x in STAGES))
+            cells = [f"{cell} ({ratio:.2f}x)" for cell, ratio in zip(cells, ratios)] + cells[len(ratios) :]
+
+        table.add_row(f"{result['events']:,}", *cells)
+
+    rich.print(table)
+
+    if len(results) > 1:
+        table = Table(title="Scaling exponent with respect to the previous size (1.0 is linear)")
+        table.add_column("Events", justify="right")
+        for stage in STAGES:
+            table.add_column(stage, justify="right")
+
+        exponents = {stage: scaling(results, stage) for stage in STAGES}
+        for index, result in enumerate(results[1:], start=1):
+            table.add_row(f"{result['events']:,}", *(f"{exponents[x][index]:.2f}" for x in STAGES))
+
+        rich.print(table)
+
+
+def plot_results(results: list[dict], png_file: Path):
+    """Save the scaling curves on log-log axes."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    events = [x["events"] for x in results]
+    for stage in STAGES:
+        ax.plot(events, [x["median"][stage] for x in results], marker="o", label=stage)
+
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Events")
+    ax.set_ylabel("Median time (s)")
+    ax.set_title("Occurrences pipeline scaling")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+
+    fig.savefig(png_file)
+
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    sizes: Annotated[list[int] | None, typer.Option(help="The number of events, can be repeated.")] = None,
+    events_per_day: Annotated[int, typer.Option(help="The mean number of events per day.")] = EVENTS_PER_DAY,
+    repeat: Annotated[int, typer.Option(help="The number of runs per size, the median is reported.")] = REPEAT,
+    seed: Annotated[int, typer.Option(help="The seed for the synthetic data.")] = SEED,
+    render_mode: Annotated[str, typer.Option(help="The render mode: scatter, density, or auto.")] = "auto",
+    workdir: Annotated[Path | None, typer.Option(help="Keep the generated files in this folder.")] = None,
+    output: Annotated[Path | None, typer.Option(help="Save the results as JSON.")] = None,
+    compare: Annotated[Path | None, typer.Option(help="Compare with the results in this JSON file.")] = None,
+    plot: Annotated[Path | None, typer.Option(help="Save the scaling curves as PNG.")] = None,
+):
+    """Benchmark the stages of the occurrences pipeline for synthetic data of increasing size."""
+    import matplotlib
+    import numpy as np
+    import pandas as pd
+
+    use_headless_backend()
+
+    sizes = sorted(sizes or SIZES)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folder = workdir or Path(tmp_dir)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        results = []
+
+        for index, size in enumerate(sizes):
+            days = max(size // events_per_day, 1)
+            yaml_file = folder / f"occurrences-{size}.yaml"
+            events = generate_yaml(yaml_file, days, size // days, seed=seed, render_mode=render_mode)
+
+            rich.print(f"Running {repeat} time(s) with {events:,} events over {days:,} days")
+
+            # The first run of the first size also pays for the imports, it is not counted.
+            if index == 0:
+                run_once(yaml_file)
+
+            runs = [run_once(yaml_file) for _ in range(repeat)]
+
+            results.append(
+                {
+                    "events": events,
+                    "days": days,
+                    "runs": runs,
+                    "median": {stage: statistics.median(run[stage] for run in runs) for stage in STAGES},
+                }
+            )
+
+    baseline = json.loads(compare.read_text()) if compare else None
+
+    print_results(results, baseline)
+
+    if output:
+        report = {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "settings": {"events_per_day": events_per_day, "repeat": repeat, "seed": seed, "render_mode": render_mode},
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np.__version__,
+                "pandas": pd.__version__,
+                "matplotlib": matplotlib.__version__,
+            },
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=4))
+        rich.print(f"Results saved in {output}")
+
+    if plot:
+        plot_results(results, plot)
+        rich.print(f"Scaling curves saved in {plot}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,183 @@
+"""
+A small HTTP endpoint on localhost to post occurrences to the watched YAML files.
+
+The endpoint is started by the occurrences daemon with `--serve-port <port>`, see the
+occurrences module for the usage.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import threading
+
+import rich
+
+from metrics.generic.occurrences import FLUSH_INTERVAL
+from metrics.generic.occurrences import INGEST_HOST
+from metrics.generic.occurrences import OccurrencesConfig
+from metrics.generic.occurrences import split_times
+from metrics.generic.occurrences_store import append_occurrences
+from metrics.generic.occurrences_store import append_to_yaml
+from metrics.generic.occurrences_store import encode_occurrences
+
+
+def parse_event(event: dict) -> tuple[str, str]:
+    """Returns the (date, time) row for a posted event, the date and the time default to now."""
+    now = datetime.datetime.now()
+
+    date = str(event.get("date") or now.date().isoformat())
+    time_str = str(event.get("time") or now.strftime("%H:%M"))
+
+    import pandas as pd
+
+    datetime.date.fromisoformat(date)
+    split_times(pd.Series([time_str]))
+
+    return date, time_str
+
+
+class IngestServer:
+    """
+    A small HTTP endpoint on localhost to post occurrences, e.g. from a phone shortcut or a script.
+
+        POST /<YAML stem>  {"time": "HH:MM", "date": "YYYY-MM-DD"}  or a list of these objects
+        GET /              the YAML files that accept occurrences, and the number of buffered ones
+
+    The time and the date are optional and default to now. When only one YAML file is served,
+    the name can be left out of the path. The occurrences are buffered and written in one batch
+    per flush interval, to the store when the YAML file configures one, otherwise to the data
+    section of the YAML file. The watcher then triggers one render per batch.
+
+    The server runs its own asyncio event loop in a background thread.
+    """
+
+    def __init__(self, configs: list[OccurrencesConfig], port: int, flush_interval: float = FLUSH_INTERVAL):
+        self.configs = {config.yaml_file.stem: config for config in configs}
+        self.port = port
+        self.flush_interval = flush_interval
+        self.buffers: dict[str, list[tuple[str, str]]] = {}
+        self._thread: threading.Thread | None = None
+        self._loop = None
+        self._stop = None
+        self._started = threading.Event()
+        self._error: BaseException | None = None
+
+    def start(self):
+        """Start the server thread, returns when the server is listening."""
+        self._thread = threading.Thread(target=self._run, name="IngestServer", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+        if self._error:
+            raise self._error
+
+    def stop(self):
+        """Stop the server, the buffered occurrences are written before the thread ends."""
+        if self._loop and self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._thread.join()
+
+    def _run(self):
+        import asyncio
+
+        try:
+            asyncio.run(self._serve())
+        except BaseException as exc:
+            self._error = exc
+            self._started.set()
+
+    async def _serve(self):
+        import asyncio
+
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+
+        server = await asyncio.start_server(self._handle, INGEST_HOST, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+
+        rich.print(f"Accepting occurrences on http://{INGEST_HOST}:{self.port}/ for {', '.join(self.configs)}")
+
+        async with server:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self.flush()
+
+    async def flush(self):
+        """Write the buffered occurrences, one write per YAML file."""
+        import asyncio
+
+        batches, self.buffers = self.buffers, {}
+
+        for name, rows in batches.items():
+            config = self.configs[name]
+            try:
+                await asyncio.to_thread(write_occurrences, config, rows)
+            except Exception as exc:
+                rich.print(f"[red]ERROR: Could not write {len(rows)} occurrence(s) for {name}: {type(exc).__name__}, {exc}[/]")
+                # Keep the occurrences for the next flush
+                self.buffers.setdefault(name, [])[:0] = rows
+
+    async def _handle(self, reader, writer):
+        try:
+            status, body = await self._respond(reader)
+        except Exception as exc:
+            status, body = 400, {"error": f"{type(exc).__name__}: {exc}"}
+
+        reasons = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+        payload = json.dumps(body).encode()
+
+        writer.write(
+            f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: close\r\n\r\n".encode()
+            + payload
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _respond(self, reader) -> tuple[int, dict]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        method, target = request_line[0], request_line[1]
+
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        name = target.split("?")[0].strip("/")
+
+        if method == "GET" and not name:
+            return 200, {"files": list(self.configs), "buffered": {k: len(v) for k, v in self.buffers.items()}}
+
+        if method != "POST":
+            return 405, {"error": f"Method {method} not allowed, use POST /<name>"}
+
+        if not name and len(self.configs) == 1:
+            name = next(iter(self.configs))
+
+        if name not in self.configs:
+            return 404, {"error": f"Unknown name '{name}', expected one of {list(self.configs)}"}
+
+        length = int(headers.get("content-length", 0))
+        content = (await reader.readexactly(length)).decode() if length else ""
+        events = json.loads(content) if content.strip() else {}
+        events = events if isinstance(events, list) else [events]
+
+        rows = [parse_event(event) for event in events]
+        self.buffers.setdefault(name, []).extend(rows)
+
+        return 202, {"accepted": len(rows), "buffered": len(self.buffers[name])}
+
+
+def write_occurrences(config: OccurrencesConfig, rows: list[tuple[str, str]]):
+    """Write the (date, time) rows to the store of the YAML file, or to its data section when there is no store."""
+    if config.store:
+        append_occurrences(config.store, encode_occurrences(rows))
+    else:
+        append_to_yaml(config.yaml_file, rows)
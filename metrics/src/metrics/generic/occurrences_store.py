@@ -0,0 +1,299 @@
+"""
+The append-only binary store for the occurrences, an alternative to the data section of the YAML file.
+
+The store is configured in the YAML file with `store: <path relative to the YAML file>`, see
+the occurrences module for the commands to convert between both layouts.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+import os
+import re
+
+from metrics.generic.occurrences import DATA_SECTION_PATTERN
+from metrics.generic.occurrences import DATE_KEY_PATTERN
+from metrics.generic.occurrences import EPOCH_ORDINAL
+from metrics.generic.occurrences import TOP_LEVEL_KEY_PATTERN
+from metrics.generic.occurrences import DailyCounts
+from metrics.generic.occurrences import format_minutes
+from metrics.generic.occurrences import load_yaml
+from metrics.generic.occurrences import read_rows
+from metrics.generic.occurrences import split_times
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+# The occurrences can also be kept in an append-only binary store instead of the data section
+# of the YAML file. The store is a header followed by fixed-width records: the day (days since
+# 1970-01-01), the minute of the day, and the flag bits for the R, Z, and D suffixes.
+
+STORE_MAGIC = b"OCCLOG\x00\x01"
+STORE_FIELDS = [("day", "<i4"), ("minute", "<u2"), ("flags", "u1")]
+STORE_SUFFIX = ".occlog"
+FLAG_RED, FLAG_BLACK, FLAG_D = 1, 2, 4
+
+# The top-level key in the YAML file that configures the store, it is left out on export.
+
+STORE_KEY_PATTERN = re.compile(rb"^store:.*(\n|$)", re.MULTILINE)
+
+
+def _store_dtype():
+    import numpy as np
+
+    return np.dtype(STORE_FIELDS)
+
+
+def encode_occurrences(rows: list[tuple]) -> np.ndarray:
+    """Returns the store records for the (date, time) rows as they are read from the YAML file."""
+    import numpy as np
+    import pandas as pd
+
+    records = np.zeros(len(rows), dtype=_store_dtype())
+
+    if not rows:
+        return records
+
+    dates, times = zip(*rows)
+    _, hours, minutes, flags = split_times(pd.Series(times))
+
+    records["day"] = pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]").astype(np.int64)
+    records["minute"] = hours * 60 + minutes
+    records["flags"] = np.select([flags == "r", flags == "z", flags == "d"], [FLAG_RED, FLAG_BLACK, FLAG_D], 0)
+
+    return records
+
+
+def decode_times(records: np.ndarray, suffix: bool = True) -> np.ndarray:
+    """Returns the 'HH:MM' time strings for the records, with the R, Z, or D suffix when requested."""
+    import numpy as np
+
+    times = format_minutes(records["minute"])
+
+    if suffix:
+        flags = records["flags"]
+        codes = np.select([flags & FLAG_RED > 0, flags & FLAG_BLACK > 0, flags & FLAG_D > 0], [1, 2, 3], 0)
+        times = times + np.array(["", "R", "Z", "D"], dtype=object)[codes]
+
+    return times
+
+
+def read_store(store: Path, start: int = 0) -> np.ndarray:
+    """
+    Returns the records in the store from record number start onwards, read with a single
+    np.fromfile(). A partially written record at the end of the store is not returned.
+    """
+    import numpy as np
+
+    dtype = _store_dtype()
+
+    with open(store, "rb") as fd:
+        if fd.read(len(STORE_MAGIC)) != STORE_MAGIC:
+            raise ValueError(f"{store} is not an occurrences store")
+
+        count = (os.fstat(fd.fileno()).st_size - len(STORE_MAGIC)) // dtype.itemsize - start
+        if count <= 0:
+            return np.zeros(0, dtype=dtype)
+
+        return np.fromfile(fd, dtype=dtype, count=count, offset=start * dtype.itemsize)
+
+
+def append_occurrences(store: Path, records: np.ndarray):
+    """Append the records to the store with one write, the store is created when it doesn't exist."""
+    records = records.astype(_store_dtype(), copy=False)
+
+    with open(store, "ab") as fd:
+        if fd.tell() == 0:
+            fd.write(STORE_MAGIC)
+        fd.write(records.tobytes())
+
+
+def write_store(store: Path, records: np.ndarray):
+    """(Re-)write the store with the records, the file is replaced atomically."""
+    tmp_path = store.with_name(f".{store.name}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    append_occurrences(tmp_path, records)
+    os.replace(tmp_path, store)
+
+
+@dataclass
+class StoreState:
+    """The records and the daily counts of a store, as read by the previous render."""
+
+    ino: int
+    size: int
+    records: np.ndarray
+    daily: DailyCounts
+
+
+_STORE_STATE: dict[Path, StoreState] = {}
+
+
+def read_store_records(store: Path) -> tuple[np.ndarray, DailyCounts]:
+    """
+    Returns all records in the store and the daily counts.
+
+    The store is append-only, so only the records that were appended since the previous
+    read are read from the file and added to the daily counts. The store is read again
+    from the start when it was replaced or truncated.
+    """
+    import numpy as np
+
+    store = Path(store).resolve()
+    stat = store.stat()
+    state = _STORE_STATE.get(store)
+
+    if state and state.ino == stat.st_ino and state.size <= stat.st_size:
+        records = read_store(store, start=len(state.records))
+        if len(records):
+            state.records = np.concatenate([state.records, records])
+            state.daily.add_ordinals(records["day"].astype(np.int64) + EPOCH_ORDINAL)
+    else:
+        records = read_store(store)
+        daily = DailyCounts.from_ordinals(records["day"].astype(np.int64) + EPOCH_ORDINAL)
+        state = _STORE_STATE[store] = StoreState(ino=stat.st_ino, size=0, records=records, daily=daily)
+
+    state.size = len(STORE_MAGIC) + len(state.records) * state.records.itemsize
+
+    return state.records, state.daily
+
+
+def store_frame(records: np.ndarray) -> pd.DataFrame:
+    """Returns the occurrences in the store records with the same columns as load_data()."""
+    import pandas as pd
+
+    flags = records["flags"]
+
+    return pd.DataFrame(
+        {
+            "date": records["day"].astype("datetime64[D]").astype("datetime64[ns]"),
+            "time": decode_times(records, suffix=False),
+            "is_red": flags & FLAG_RED > 0,
+            "is_black": flags & FLAG_BLACK > 0,
+            "time_numeric": records["minute"] / 60.0,
+        }
+    )
+
+
+def import_yaml(yaml_file: Path, store: Path) -> int:
+    """Write the occurrences from the data section of the YAML file to the store, returns the number of records."""
+    _, rows = read_rows(yaml_file, incremental=False)
+    records = encode_occurrences(rows)
+    write_store(store, records)
+
+    return len(records)
+
+
+def _data_line(date: str, times) -> str:
+    """Returns the line for one date entry in the data section of the YAML file."""
+    return f"    '{date}': [{', '.join(repr(str(x)) for x in times)}]"
+
+
+def _data_entries(content: bytes, start: int, end: int) -> list[tuple[str, int, int]]:
+    """
+    Returns the date, and the start and end offsets of each date entry in the data section
+    between start and end. The comment and blank lines after an entry are not part of it.
+    """
+    keys = list(DATE_KEY_PATTERN.finditer(content, start, end))
+    entries = []
+
+    for key, next_key in zip(keys, keys[1:] + [None]):
+        lines = content[key.start() : next_key.start() if next_key else end].splitlines(keepends=True)
+        while len(lines) > 1 and (not lines[-1].strip() or lines[-1].lstrip().startswith(b"#")):
+            lines.pop()
+        entries.append((key.group(1).decode(), key.start(), key.start() + sum(map(len, lines))))
+
+    return entries
+
+
+def append_to_yaml(yaml_file: Path, rows: list[tuple[str, str]]):
+    """
+    Add the (date, time) rows to the data section of the YAML file.
+
+    Only the date entries that get new times are rewritten, the entries for new dates are
+    inserted in date order. The rest of the file, i.e. the comments and the keys before and
+    after the data section, is kept as is. When all rows are for the last date in the file
+    or later, the content before the last date entry doesn't change, so the next read is a
+    cheap tail parse. The file is replaced atomically.
+    """
+    content = yaml_file.read_bytes()
+    if not content.endswith(b"\n"):
+        content += b"\n"
+
+    data_section = DATA_SECTION_PATTERN.search(content)
+
+    if data_section is None:
+        content = (content.rstrip() + b"\n\n" if content.strip() else b"") + b"data:\n"
+        data_section = DATA_SECTION_PATTERN.search(content)
+
+    # The data section ends at the next top-level key, if any
+    top_level_key = TOP_LEVEL_KEY_PATTERN.search(content, data_section.end())
+    end = top_level_key.start() if top_level_key else len(content)
+
+    entries = _data_entries(content, data_section.end(), end)
+    after_entries = entries[-1][2] if entries else content.index(b"\n", data_section.end()) + 1
+
+    new_data: dict[str, list[str]] = {}
+    for date, time_str in rows:
+        new_data.setdefault(str(date), []).append(time_str)
+
+    edits = []
+    for date, times in new_data.items():
+        entry = next((entry for entry in entries if entry[0] == date), None)
+        if entry:
+            _, lo, hi = entry
+            old_times = next(iter(load_yaml(b"data:\n" + content[lo:hi])["data"].values())) or []
+            edits.append((lo, hi, _data_line(date, [*old_times, *times])))
+        else:
+            lo = next((lo for key, lo, _ in entries if key > date), after_entries)
+            edits.append((lo, lo, _data_line(date, times)))
+
+    parts, offset = [], 0
+    for lo, hi, line in sorted(edits):
+        parts += [content[offset:lo], line.encode() + b"\n"]
+        offset = hi
+    parts.append(content[offset:])
+
+    tmp_path = yaml_file.with_name(f".{yaml_file.name}.tmp")
+    tmp_path.write_bytes(b"".join(parts))
+    os.replace(tmp_path, yaml_file)
+
+
+def export_yaml(store: Path, yaml_file: Path) -> int:
+    """
+    Write the occurrences in the store as the data section of the YAML file, returns the
+    number of records. The other keys of an existing file are kept, except the store key,
+    the exported file reads its occurrences from the data section.
+    """
+    import numpy as np
+
+    records = read_store(store)
+    records = records[np.argsort(records["day"], kind="stable")]
+    times = decode_times(records)
+
+    header, trailer = b"", b""
+    if yaml_file.exists():
+        content = yaml_file.read_bytes()
+        data_section = DATA_SECTION_PATTERN.search(content)
+        if data_section:
+            top_level_key = TOP_LEVEL_KEY_PATTERN.search(content, data_section.end())
+            header = content[: data_section.start()]
+            trailer = b"\n" + content[top_level_key.start() :] if top_level_key else b""
+        else:
+            header = content.rstrip() + b"\n\n"
+
+    header, trailer = STORE_KEY_PATTERN.sub(b"", header), STORE_KEY_PATTERN.sub(b"", trailer)
+
+    lines = ["data:"]
+    days, starts = np.unique(records["day"], return_index=True)
+    for day, lo, hi in zip(days, starts, np.append(starts[1:], len(records))):
+        lines.append(_data_line(str(np.datetime64(int(day), "D")), times[lo:hi]))
+
+    tmp_path = yaml_file.with_name(f".{yaml_file.name}.tmp")
+    tmp_path.write_bytes(header + "\n".join(lines).encode() + b"\n" + trailer)
+    os.replace(tmp_path, yaml_file)
+
+    return len(records)
@@ -1,25 +1,266 @@
+import io
 import os
-import datetime
+import zlib
+from pathlib import Path
+
 import logme
 import numpy as np
 import pandas as pd
 
-HOME_DIR = os.path.expanduser('~')
+HERE = Path(__file__).parent
+
+INPUT_FILENAME = HERE.parent / "data" / "meterstanden.csv"
+
+DATE_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+# The meter columns in the csv file, all values are parsed as floats, empty cells are NaN.
+
+COLUMNS = ['Gas', 'eDag', 'eNacht', 'SMA_3000', 'SMA_7000', 'SMA', 'Temperatuur', 'Water']
+
+# The field names of the structured array, these are the names that np.recfromcsv() used.
+
+FIELDS = [name.lower() for name in COLUMNS]
+
+# The parsed columns are cached next to the csv file, the cache is valid as long as the
+# modification time and the size of the csv file didn't change.
+
+CACHE_SUFFIX = ".cache.npz"
+
+# The csv file only grows, new readings are appended at the end. On refresh only the bytes
+# after the last parsed line are read. The first and the last TAIL_CHECK_SIZE bytes before
+# that offset are checked to detect changes to the earlier lines.
+
+TAIL_CHECK_SIZE = 4096
+
+_CACHE = {}
+_TAIL = {}
+
+
+class Readings:
+    """
+    The meter readings from the csv file, parsed once into typed columns.
+
+    All meter values are kept in one 2D float array with one column per meter. Both views
+    share that memory, nothing is copied:
+
+        df    : a DataFrame with the Date_Time index and the meter columns
+        data  : a structured array with the lowercase field names, e.g. data['gas']
+        dt    : the Date_Time values as datetime64
+    """
+
+    def __init__(self, date_time, values, filename=None):
+        self.filename = filename
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.dt = np.asarray(date_time, dtype='datetime64[ns]')
+
+        index = pd.DatetimeIndex(self.dt, name='Date_Time')
+        self.df = pd.DataFrame(self.values, index=index, columns=COLUMNS, copy=False)
+
+        self.data = self.values.view(np.dtype([(name, np.float64) for name in FIELDS])).reshape(-1)
+
+    def __len__(self):
+        return len(self.dt)
+
+    @classmethod
+    def from_csv(cls, filename):
+        return cls(*parse_csv(filename), filename)
+
+
+class TailState:
+    """
+    Where the reader stopped in the csv file.
+
+        offset     : the byte offset after the last complete line that was parsed
+        rows       : the number of rows before that offset, a last line without newline is parsed again
+        checksum   : the checksum of the bytes before offset, see checksum()
+        last_time  : the timestamp of the last row before offset
+    """
+
+    def __init__(self, offset, rows, checksum, last_time):
+        self.offset = offset
+        self.rows = rows
+        self.checksum = checksum
+        self.last_time = last_time
+
+
+def parse_csv(source, header=True):
+    """Returns the timestamps and the values of the rows in the csv source, a filename or a file object."""
+    names = None if header else ['Date_Time'] + COLUMNS
+
+    try:
+        df = pd.read_csv(
+            source, comment='#', names=names, dtype={name: np.float64 for name in COLUMNS}, engine='c'
+        )
+    except pd.errors.EmptyDataError:
+        return np.empty(0, dtype='datetime64[ns]'), np.empty((0, len(COLUMNS)), dtype=np.float64)
+
+    # Vectorized conversion of the timestamps, the format is known so no per-row guessing
+    date_time = pd.to_datetime(df['Date_Time'], format=DATE_TIME_FORMAT)
+
+    return date_time.to_numpy(), df[COLUMNS].to_numpy(dtype=np.float64)
+
+
+def checksum(fd, offset):
+    """Returns the checksum of the first and the last TAIL_CHECK_SIZE bytes before offset."""
+    fd.seek(0)
+    crc = zlib.crc32(fd.read(min(offset, TAIL_CHECK_SIZE)))
+
+    start = max(offset - TAIL_CHECK_SIZE, 0)
+    fd.seek(start)
+
+    return zlib.crc32(fd.read(offset - start), crc)
+
+
+def read_csv(filename):
+    """Parses the complete csv file, returns the Readings and the TailState."""
+    content = Path(filename).read_bytes()
+    offset = content.rfind(b'\n') + 1
+
+    date_time, values = parse_csv(io.BytesIO(content[:offset]))
+    rows = len(date_time)
+
+    # A last line without newline is parsed, but will be parsed again on refresh
+
+    if content[offset:].strip():
+        tail_time, tail_values = parse_csv(io.BytesIO(content[offset:]), header=rows == 0 and offset == 0)
+        date_time = np.concatenate((date_time, tail_time))
+        values = np.concatenate((values, tail_values))
+
+    with io.BytesIO(content) as fd:
+        state = TailState(offset, rows, checksum(fd, offset), date_time[rows - 1] if rows else None)
+
+    return Readings(date_time, values, filename), state
+
+
+def read_tail(filename, readings, state):
+    """
+    Parses only the lines that were appended since the readings were loaded.
+
+    Returns the extended Readings and TailState, or None when the earlier lines were changed
+    and the file must be loaded again.
+    """
+    with open(filename, 'rb') as fd:
+        fd.seek(0, os.SEEK_END)
+        if fd.tell() < state.offset or checksum(fd, state.offset) != state.checksum:
+            return None
+
+        fd.seek(state.offset)
+        content = fd.read()
+
+        offset = content.rfind(b'\n') + 1
+
+        new_time, new_values = parse_csv(io.BytesIO(content[:offset]), header=False)
+
+        # The last line can be incomplete while it is being written, it is skipped until it can be parsed
+
+        try:
+            tail_time, tail_values = parse_csv(io.BytesIO(content[offset:]), header=False)
+        except (ValueError, pd.errors.ParserError):
+            tail_time, tail_values = parse_csv(io.BytesIO(b''), header=False)
+
+        offset += state.offset
+        new_checksum = checksum(fd, offset)
+
+    date_time = np.concatenate((readings.dt[:state.rows], new_time, tail_time))
+
+    # The appended readings should not go back in time
+
+    if state.last_time is not None and len(date_time) > state.rows and date_time[state.rows] < state.last_time:
+        return None
+
+    values = np.concatenate((readings.values[:state.rows], new_values, tail_values))
+    rows = state.rows + len(new_time)
+
+    new_state = TailState(offset, rows, new_checksum, date_time[rows - 1] if rows else None)
+
+    return Readings(date_time, values, filename), new_state
+
+
+def cache_path(filename):
+    filename = Path(filename)
+    return filename.with_name(filename.stem + CACHE_SUFFIX)
+
+
+def read_cache(filename, stat):
+    try:
+        with np.load(cache_path(filename)) as cache:
+            if int(cache['mtime_ns']) != stat.st_mtime_ns or int(cache['size']) != stat.st_size:
+                return None
+            if list(cache['columns']) != COLUMNS:
+                return None
+            readings = Readings(cache['date_time'], cache['values'], filename)
+            offset, rows = int(cache['offset']), int(cache['rows'])
+        with open(filename, 'rb') as fd:
+            state = TailState(offset, rows, checksum(fd, offset), readings.dt[rows - 1] if rows else None)
+        return readings, state
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def write_cache(filename, stat, readings, state):
+    path = cache_path(filename)
+    tmp_path = path.with_name(f".{path.name}.tmp.npz")
+
+    np.savez(
+        tmp_path,
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        columns=np.array(COLUMNS),
+        date_time=readings.dt,
+        values=readings.values,
+        offset=state.offset,
+        rows=state.rows,
+    )
+    os.replace(tmp_path, path)
+
 
 @logme.log
-def load_data(logger=None):
-    # Read the input csv file
-    input_filename = 'Documents/PyCharmProjects/Meterstanden/Data/Meterstanden.csv'
+def load_readings(filename=INPUT_FILENAME, use_cache=True, logger=None):
+    """
+    Returns the meter readings from the csv file.
+
+    The readings are kept in memory and in a cache file next to the csv file, both are
+    re-used as long as the csv file is not modified. When lines were appended to the csv
+    file, only the new lines are parsed and added to the readings in memory.
+    """
+    filename = Path(filename).expanduser().resolve()
+    stat = filename.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    if use_cache:
+        cached = _CACHE.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        if cached and (result := read_tail(filename, cached[1], _TAIL[filename])):
+            readings, _TAIL[filename] = result
+            logger.info("Read {} new meter readings from {}.".format(len(readings) - len(cached[1]), filename))
+            _CACHE[filename] = (key, readings)
+            return readings
+
+        if result := read_cache(filename, stat):
+            readings, _TAIL[filename] = result
+            logger.info("Reading meter readings from cache {}.".format(cache_path(filename)))
+            _CACHE[filename] = (key, readings)
+            return readings
+
+    logger.info("Reading input csv file from {}.".format(filename))
 
-    logger.info("Reading input csv file from {}.".format(input_filename))
+    readings, state = read_csv(filename)
 
-    data = np.recfromcsv(os.path.join(HOME_DIR, input_filename))
+    if use_cache:
+        try:
+            write_cache(filename, stat, readings, state)
+        except OSError as exc:
+            logger.warning("Could not write cache file {}: {}".format(cache_path(filename), exc))
+        _CACHE[filename] = (key, readings)
+        _TAIL[filename] = state
 
-    # Read the input csv file, make the Date_Time column the index column and parse the dates
-    df = pd.read_csv(os.path.join(HOME_DIR, input_filename), index_col="Date_Time", parse_dates=True)
+    return readings
 
-    # Convert the byte string b'' into a 'normal' string
 
-    dt = np.array([datetime.datetime.strptime(x.decode('UTF-8'), '%Y-%m-%d %H:%M') for x in data['date_time']])
+def load_data(filename=INPUT_FILENAME):
+    """Returns the structured array, the DataFrame, and the timestamps of the meter readings."""
+    readings = load_readings(filename)
 
-    return data, df, dt
+    return readings.data, readings.df, readings.dt
@@ -0,0 +1,191 @@
+import copy
+import threading
+
+import logme
+import numpy as np
+import pandas as pd
+
+NS_PER_DAY = 24 * 60 * 60 * 1_000_000_000
+
+# The rates are calculated between consecutive readings of the same meter, rows where the
+# meter has no value (an empty cell in the csv file) are skipped.
+
+RATES = {
+    'gas_per_day': ['Gas'],
+    'electricity_per_day': ['eDag', 'eNacht'],
+}
+
+SERIES = ['gas_per_day', 'electricity_per_day', 'consumption_per_day', 'solar_total', 'sma_ratio']
+
+_DERIVED = {}
+_LOCK = threading.Lock()
+
+
+class DerivedSeries:
+    """
+    The series that are derived from the meter readings.
+
+        gas_per_day         : the gas consumption per day between consecutive readings [m3/dag]
+        electricity_per_day : the net electricity consumption per day, day and night counter [kWh/dag]
+        consumption_per_day : the electricity consumption per day, including the solar panel yield [kWh/dag]
+        solar_total         : the total yield of both solar panel inverters for the previous reading [kWh]
+        sma_ratio           : the ratio of the SMA 7000 and SMA 3000 yield, this should be ± 2.28
+
+    All series are calculated in one vectorized pass over the readings. When the readings are
+    extended with new rows, only the new rows are processed and appended to the series.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.readings = None
+        self.rows = 0
+
+        # Per series, the row numbers in the readings and the values at those rows
+        self._index = {name: np.empty(0, dtype=np.int64) for name in SERIES}
+        self._values = {name: np.empty(0, dtype=np.float64) for name in SERIES}
+
+        # Per rate, the row number of the last valid reading that was processed
+        self._last = {name: None for name in RATES}
+
+        self._series = {}
+
+    def is_extension_of(self, readings):
+        """True if the readings that were processed are the first rows of the given readings."""
+        if self.readings is None or not self.rows or len(readings) < self.rows:
+            return False
+
+        last = self.rows - 1
+
+        return (
+            readings.dt[0] == self.readings.dt[0] and readings.dt[last] == self.readings.dt[last]
+            and np.array_equal(readings.values[last], self.readings.values[last], equal_nan=True)
+        )
+
+    def update(self, readings):
+        """
+        Brings the series up-to-date with the readings, returns the number of processed rows.
+
+        Nothing is calculated when the readings were already processed. When the readings are
+        the previous readings with new rows appended, only the new rows are processed.
+        Otherwise, all series are recalculated.
+        """
+        if readings is self.readings:
+            return 0
+
+        if not self.is_extension_of(readings):
+            self.reset()
+
+        start = self.rows
+
+        self._extend(readings, start)
+
+        self.readings = readings
+        self.rows = len(readings)
+        self._series = {}
+
+        return self.rows - start
+
+    def _extend(self, readings, start):
+        df = readings.df
+        ns = readings.dt.view(np.int64)
+        rows = np.arange(start, len(readings))
+
+        rates = {}
+
+        for name, columns in RATES.items():
+
+            total = df[columns[0]].to_numpy()
+            for column in columns[1:]:
+                total = total + df[column].to_numpy()
+
+            # The rows with a valid reading, prepend the last valid row that was processed before
+
+            valid = rows[~np.isnan(total[start:])]
+            if self._last[name] is not None:
+                valid = np.concatenate(([self._last[name]], valid))
+            if len(valid):
+                self._last[name] = valid[-1]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rates[name] = valid[1:], np.diff(total[valid]) / (np.diff(ns[valid]) / NS_PER_DAY)
+
+        # The solar panel yield is recorded for the day of the previous reading
+
+        z = df.SMA_3000.to_numpy() + df.SMA_7000.to_numpy()
+        z_previous = np.concatenate(([np.nan], z))[rows]
+
+        e_index, e_per_day = rates['electricity_per_day']
+
+        new = dict(rates)
+        new['consumption_per_day'] = e_index, e_per_day + z_previous[e_index - start]
+        new['solar_total'] = rows[~np.isnan(z_previous)], z_previous[~np.isnan(z_previous)]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new['sma_ratio'] = rows, df.SMA_7000.to_numpy()[start:] / df.SMA_3000.to_numpy()[start:]
+
+        for name, (index, values) in new.items():
+            self._index[name] = np.concatenate((self._index[name], index))
+            self._values[name] = np.concatenate((self._values[name], values))
+
+    def snapshot(self):
+        """
+        Returns a copy of the series that is not changed by later updates.
+
+        The arrays and the pandas Series that were already created are shared with the copy.
+        An update replaces these, but never modifies them in place.
+        """
+        snapshot = copy.copy(self)
+        snapshot._index = dict(self._index)
+        snapshot._values = dict(self._values)
+        snapshot._last = dict(self._last)
+
+        return snapshot
+
+    def series(self, name):
+        """Returns the derived series as a pandas Series with the Date_Time index."""
+        if name not in self._series:
+            index = pd.DatetimeIndex(self.readings.dt[self._index[name]], name='Date_Time')
+            self._series[name] = pd.Series(self._values[name], index=index, name=name)
+
+        return self._series[name]
+
+    @property
+    def gas_per_day(self):
+        return self.series('gas_per_day')
+
+    @property
+    def electricity_per_day(self):
+        return self.series('electricity_per_day')
+
+    @property
+    def consumption_per_day(self):
+        return self.series('consumption_per_day')
+
+    @property
+    def solar_total(self):
+        return self.series('solar_total')
+
+    @property
+    def sma_ratio(self):
+        return self.series('sma_ratio')
+
+
+@logme.log
+def derived_series(readings, logger=None):
+    """
+    Returns the derived series for the readings.
+
+    The derived series are kept in memory per csv file, they are only calculated for rows that
+    were not processed before. A snapshot is returned, so the series don't change when another
+    thread updates them for newer readings.
+    """
+    # The series can be requested from several worker threads at the same time
+    with _LOCK:
+        derived = _DERIVED.setdefault(readings.filename, DerivedSeries())
+
+        if count := derived.update(readings):
+            logger.debug("Calculated the derived series for {} rows.".format(count))
+
+        return derived.snapshot()
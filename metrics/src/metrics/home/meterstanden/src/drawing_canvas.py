@@ -67,6 +67,84 @@ class DrawingCanvas(FigureCanvas):
 
         FigureCanvas.updateGeometry(self)
 
+        # The lines with the data are animated, i.e. they are not part of a full draw. After a
+        # full draw the static background is kept and the lines are drawn on top of it. When only
+        # the data changes, the background is restored and the lines are blitted.
+
+        self.lines = []
+        self.background = None
+
+        self.mpl_connect('draw_event', self.onDraw)
+
+
+    def plotLines(self, x, y, *fmts):
+        """Plot the data once for each format, the lines are kept to update their data later."""
+
+        self.lines = [line for fmt in fmts for line in self.axes.plot(x, y, fmt, animated=True)]
+        self.background = None
+
+
+    def updateLines(self, x, y):
+        """
+        Update the data of the lines. Returns False when there are no lines yet, the caller
+        should then create the plot with plotLines().
+
+        A full draw is only done when the axes limits change, i.e. when the data falls outside
+        the current view and the view was not zoomed or panned by the user.
+        """
+
+        if not self.lines:
+            return False
+
+        for line in self.lines:
+            line.set_data(x, y)
+
+        if self.axes.get_autoscale_on():
+            view = self.axes.viewLim.bounds
+            self.axes.relim()
+            self.axes.autoscale_view()
+            if self.axes.viewLim.bounds != view:
+                self.background = None
+
+        if self.background is None:
+            self.draw_idle()
+            return True
+
+        self.restore_region(self.background)
+        self.drawLines()
+        self.blit(self.fig.bbox)
+
+        return True
+
+
+    def drawLines(self):
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+
+    def print_figure(self, *args, **kwargs):
+
+        # The animated lines are not part of a full draw, include them in the saved figure
+
+        for line in self.lines:
+            line.set_animated(False)
+        try:
+            return super().print_figure(*args, **kwargs)
+        finally:
+            for line in self.lines:
+                line.set_animated(True)
+
+
+    def onDraw(self, event):
+
+        # The figure is also drawn when it is saved, for e.g. SVG or PDF by another canvas.
+        # The background is only kept for a draw on the screen.
+
+        if not self.lines or event.canvas is not self or self.is_saving():
+            return
+
+        self.background = self.copy_from_bbox(self.fig.bbox)
+        self.drawLines()
 
 
     def setColorScheme(self, scheme):
@@ -2,6 +2,7 @@
 
 import sys
 import os
+import functools
 import logme
 import numpy as np
 import pandas as pd
@@ -11,6 +12,11 @@ import qdarkstyle
 from PyQt5 import QtCore, QtWidgets
 
 from main_window import Ui_MainWindow
+from worker import Worker
+
+import data
+import derived
+import resample
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -24,6 +30,10 @@ years = mdates.YearLocator()   # every year
 months = mdates.MonthLocator()  # every month
 yearsFmt = mdates.DateFormatter('%Y')
 
+# Wait until the csv file was not changed for this many milliseconds before loading new readings
+
+RELOAD_DELAY = 500
+
 @logme.log
 class MainWindow_EXEC():
 
@@ -50,8 +60,6 @@ class MainWindow_EXEC():
 
     #---------------------------------------------------------------------------
     def init_tabs(self):
-        import data
-        self.data, self.df, self.dt = data.load_data()
 
         # Hide the QWidget toolBar that was created in Designer and replace it
         # later with the toolBar for the selected tab
@@ -75,34 +83,163 @@ class MainWindow_EXEC():
             5 : self.ui.zonnepanelen
         }
 
-        for idx in self.drawCanvas:
-            self.drawMethod[idx](self.drawCanvas[idx])
+        # The derived series for these tabs are calculated in a worker thread, from the readings
+        # that are passed in when the calculation is started. The tab is drawn in the GUI thread
+        # when the calculation has finished.
 
-        self.drawToolbar = {
-            0 : NavigationToolbar(self.drawCanvas[0], self.MainWindow, coordinates=False),
-            1 : NavigationToolbar(self.drawCanvas[1], self.MainWindow, coordinates=False),
-            2 : NavigationToolbar(self.drawCanvas[2], self.MainWindow, coordinates=False),
-            3 : NavigationToolbar(self.drawCanvas[3], self.MainWindow, coordinates=False),
-            4 : NavigationToolbar(self.drawCanvas[4], self.MainWindow, coordinates=False),
-            5 : NavigationToolbar(self.drawCanvas[5], self.MainWindow, coordinates=False)
+        self.calculateMethod = {
+            2 : self.calculateGasVerbruikPerDag,
+            4 : self.calculateElektriciteitsVerbruikPerDag,
+            5 : self.calculateZonnepanelen
         }
 
-        for idx in self.drawToolbar:
-            self.ui.gridLayout.addWidget(self.drawToolbar[idx], 1, 1, 1, 1)
+        # A tab is drawn, and its toolbar is created, when the tab is selected for the first time
+
+        self.drawToolbar = {}
+        self.drawn = set()
+        self.busy = set()
+
+        self.readings = None
+        self.data, self.df, self.dt = None, None, None
+
+        self.loading = False
+        self.reloadPending = False
+
+        self.threadPool = QtCore.QThreadPool.globalInstance()
 
         self.ui.tabWidget.currentChanged['int'].connect(self.tabSelected)
 
         self.tabSelected(self.ui.tabWidget.currentIndex())
 
+        # Watch the csv file, and its folder because an editor might replace the file when saving.
+        # New readings are loaded when the file changes.
+
+        self.filename = str(data.INPUT_FILENAME.resolve())
+
+        self.watcher = QtCore.QFileSystemWatcher([self.filename, os.path.dirname(self.filename)])
+        self.watcher.fileChanged.connect(self.fileChanged)
+        self.watcher.directoryChanged.connect(self.directoryChanged)
+
+        self.reloadTimer = QtCore.QTimer()
+        self.reloadTimer.setSingleShot(True)
+        self.reloadTimer.setInterval(RELOAD_DELAY)
+        self.reloadTimer.timeout.connect(self.loadData)
+
+        # Load the data in a worker thread, so the window is usable immediately
+
+        self.loadData()
+
+    def runInThread(self, fn, finished, error=None):
+        worker = Worker(fn)
+        worker.signals.finished.connect(finished)
+        worker.signals.error.connect(error or self.workerError)
+        self.threadPool.start(worker)
+
+    def workerError(self, exc):
+        self.logger.error(f"Caught exception in worker thread: {type(exc).__name__}, {exc}")
+
+    def fileChanged(self, path):
+
+        # The file is no longer watched when it was replaced, it is added again by directoryChanged
+
+        if self.filename not in self.watcher.files() and os.path.exists(self.filename):
+            self.watcher.addPath(self.filename)
+
+        # Restart the timer, a burst of changes results in a single load
+
+        self.reloadTimer.start()
+
+    def directoryChanged(self, path):
+
+        if self.filename not in self.watcher.files() and os.path.exists(self.filename):
+            self.watcher.addPath(self.filename)
+            self.reloadTimer.start()
+
+    def loadData(self):
+
+        if self.loading:
+            self.reloadPending = True
+            return
+
+        self.loading = True
+        self.runInThread(functools.partial(data.load_readings, self.filename), self.dataLoaded, self.loadError)
+
+    def loadError(self, exc):
+        self.workerError(exc)
+        self.loadFinished()
+
+    def loadFinished(self):
+        self.loading = False
+
+        if self.reloadPending:
+            self.reloadPending = False
+            self.loadData()
+
+    def dataLoaded(self, readings):
+
+        if readings is not self.readings:
+
+            self.logger.debug(f"Loaded {len(readings)} readings.")
+
+            self.readings = readings
+            self.data, self.df, self.dt = readings.data, readings.df, readings.dt
+
+            # Only the visible tab is drawn again, the other tabs are drawn when selected
+
+            self.drawn.clear()
+            self.drawTab(self.ui.tabWidget.currentIndex())
+
+        self.loadFinished()
+
     def tabSelected(self, arg=None):
 
+        if arg not in self.drawToolbar:
+            self.drawToolbar[arg] = NavigationToolbar(self.drawCanvas[arg], self.MainWindow, coordinates=False)
+            self.ui.gridLayout.addWidget(self.drawToolbar[arg], 1, 1, 1, 1)
+
         for idx in self.drawToolbar:
-            self.drawToolbar[idx].setVisible(False)
-        self.drawToolbar[arg].setVisible(True)
+            self.drawToolbar[idx].setVisible(idx == arg)
+
+        self.drawTab(arg)
+
+    def drawTab(self, idx):
+        """Draw the tab if it was not drawn before, nothing is drawn until the data is loaded."""
+
+        if self.df is None or idx in self.drawn or idx in self.busy:
+            return
+
+        if idx not in self.calculateMethod:
+            self.drawMethod[idx](self.drawCanvas[idx])
+            self.drawn.add(idx)
+            return
+
+        readings = self.readings
+
+        def finished(series):
+            self.busy.discard(idx)
+
+            # New readings were loaded during the calculation, start again when still visible
+            if readings is not self.readings:
+                if idx == self.ui.tabWidget.currentIndex():
+                    self.drawTab(idx)
+                return
+
+            self.drawMethod[idx](self.drawCanvas[idx], series)
+            self.drawn.add(idx)
+
+        def error(exc):
+            self.busy.discard(idx)
+            self.workerError(exc)
+
+        self.busy.add(idx)
+        self.runInThread(functools.partial(self.calculateMethod[idx], readings), finished, error)
 
 
     def drawWaterVerbruik(self, canvas):
 
+        if canvas.updateLines(self.dt, self.data['water']):
+            return
+
         #fig = plt.figure(figsize=(FIGSIZE_X/DPI, FIGSIZE_Y/DPI), dpi=DPI)
         #fig.suptitle("Meterstanden")
 
@@ -115,8 +252,7 @@ class MainWindow_EXEC():
 
         canvas.axes.set_title(title)
 
-        canvas.axes.plot(self.dt, self.data['water'], '-')
-        canvas.axes.plot(self.dt, self.data['water'], '.')
+        canvas.plotLines(self.dt, self.data['water'], '-', '.')
 
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("Volume [m$^3$]")
@@ -155,6 +291,9 @@ class MainWindow_EXEC():
 
     def drawGasVerbruik(self, canvas):
 
+        if canvas.updateLines(self.dt, self.data['gas']):
+            return
+
         # Tell matplotlib to interpret the x-axis values as dates
 
         title = "Verbruik Gas"
@@ -167,8 +306,7 @@ class MainWindow_EXEC():
 
         canvas.axes.set_title(title)
 
-        canvas.axes.plot(self.dt, self.data['gas'], '-')
-        canvas.axes.plot(self.dt, self.data['gas'], '.')
+        canvas.plotLines(self.dt, self.data['gas'], '-', '.')
 
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("Verbruik Gas [m$^3$]")
@@ -191,32 +329,28 @@ class MainWindow_EXEC():
         canvas.draw()
 
 
-    def drawGasVerbruikPerDag(self, canvas):
+    def calculateGasVerbruikPerDag(self, readings):
 
-        title = "Gas verbruik per dag"
+        # Het verbruik van gas per dag, uit de meterstanden geïnterpoleerd op middernacht
 
-        self.logger.debug(f"Creating GUI for {title}")
-
-        # Bereken het verbruik in gas tussen twee opeenvolgende metingen
+        return resample.resample(readings, 'D').per_day('Gas')
 
-        g_diff = self.df['Gas'].diff().dropna()
 
-        # Bereken de tijd tussen twee opeenvolgende metingen in dagen (both options are the same)
+    def drawGasVerbruikPerDag(self, canvas, g_per_dag):
 
-        time_diff_days = g_diff.index.to_series().diff().astype('timedelta64[s]') / 60. / 60. / 24.
-        time_diff_days = g_diff.index.to_series().diff().dt.total_seconds().fillna(0) / 60. / 60. / 24.
+        if canvas.updateLines(g_per_dag.index, g_per_dag.to_numpy()):
+            return
 
-        # Bereken het verbruik van gas per dag
+        title = "Gas verbruik per dag"
 
-        g_per_dag = g_diff / time_diff_days
+        self.logger.debug(f"Creating GUI for {title}")
 
         canvas.axes.cla()
         canvas.setColorScheme(self.theme)
 
         canvas.axes.set_title(title)
 
-        canvas.axes.plot(g_per_dag, '-')
-        canvas.axes.plot(g_per_dag, '.')
+        canvas.plotLines(g_per_dag.index, g_per_dag.to_numpy(), '-', '.')
 
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("Verbruik Gas per Dag [m$^3$/dag]")
@@ -230,6 +364,9 @@ class MainWindow_EXEC():
 
         e_total = self.data['edag'] + self.data['enacht']
 
+        if canvas.updateLines(self.dt, e_total):
+            return
+
         title = "Verbruik Elektriciteit"
 
         self.logger.debug(f"Creating GUI for {title}")
@@ -243,8 +380,7 @@ class MainWindow_EXEC():
         canvas.axes.xaxis_date()
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("Verbruik (kWh)")
-        canvas.axes.plot(self.dt, e_total)
-        canvas.axes.plot(self.dt, e_total, '.')
+        canvas.plotLines(self.dt, e_total, '-', '.')
         canvas.axes.grid(True)
 
         plt.margins(0.05, 0.1)
@@ -252,45 +388,37 @@ class MainWindow_EXEC():
         canvas.draw()
 
 
-    def drawElektriciteitsVerbruikPerDag(self, canvas):
-
-        title = "Elektriciteitsverbruik per dag"
-
-        self.logger.debug(f"Creating GUI for {title}")
+    def calculateElektriciteitsVerbruikPerDag(self, readings):
 
-        # Bereken het verbruik in elektriciteit tussen twee opeenvolgende metingen
-        # Elektriciteit voor de dag en nacht teller eerst bijeen tellen
+        # Het totaal verbruik per dag is de sum van het elektriciteitsverbruik, uit de meterstanden
+        # geïnterpoleerd op middernacht, en de opbrengst van de zonnepanelen op die dag
 
-        e_total = self.df.eDag + self.df.eNacht
-        e_diff = e_total.diff().dropna()
+        grid = resample.resample(readings, 'D')
+        e_per_dag = grid.per_day('eDag') + grid.per_day('eNacht')
 
-        # Bereken de tijd tussen twee opeenvolgende metingen in dagen
+        z_per_dag = resample.daily_total(readings)
 
-        time_diff_days = e_diff.index.to_series().diff().dt.total_seconds().fillna(0) / 60. / 60. / 24.
+        if len(z_per_dag):
+            self.logger.debug(f"Totale opbrengst zonnepanelen op {z_per_dag.index[-1]}: {z_per_dag.iloc[-1]} [kWh]")
 
-        # Bereken het elektriciteitsverbruik per dag
+        return e_per_dag + z_per_dag.reindex(e_per_dag.index)
 
-        e_per_dag = e_diff / time_diff_days
 
-        # Bereken de totale opbrengst per dag van de zonnepanelen
+    def drawElektriciteitsVerbruikPerDag(self, canvas, ez_per_dag):
 
-        z_total = self.df.SMA_3000.shift(1) + self.df.SMA_7000.shift(1)
-        z_total = z_total.dropna()
+        if canvas.updateLines(ez_per_dag.index, ez_per_dag.to_numpy()):
+            return
 
-        self.logger.debug(f"Totale opbrengst zonnepanelen op {z_total.index[-1]}: {z_total[-1]} [kWh]")
-
-        # Het totaal verbruik per dag is de sum van het elektriciteitsverbruik en de opbrengst van de zonnepanelen
-
-        ez_per_dag = e_per_dag + z_total
+        title = "Elektriciteitsverbruik per dag"
 
+        self.logger.debug(f"Creating GUI for {title}")
 
         canvas.axes.cla()
         canvas.setColorScheme(self.theme)
 
         canvas.axes.set_title(title)
 
-        canvas.axes.plot(ez_per_dag, '-')
-        canvas.axes.plot(ez_per_dag, '.')
+        canvas.plotLines(ez_per_dag.index, ez_per_dag.to_numpy(), '-', '.')
 
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("Verbruik Elektriciteit per Dag [kWh/dag]")
@@ -300,12 +428,24 @@ class MainWindow_EXEC():
         canvas.draw()
 
 
-    def drawZonnepanelen(self, canvas):
+    def calculateZonnepanelen(self, readings):
 
         # De SMA 7000 bevat 32 zonnepanelen, de SMA 3000 bevat er 14.
         # De verhouding zou dus ± 2.28 moeten zijn
 
-        sma_ratio = self.df.SMA_7000 / self.df.SMA_3000
+        series = derived.derived_series(readings)
+
+        return series.sma_ratio, series.solar_total
+
+
+    def drawZonnepanelen(self, canvas, series):
+
+        sma_ratio, z_total = series
+
+        self.logger.debug(f"Totale opbrengst zonnepanelen [kWh]:\n{z_total.tail(20)}")
+
+        if canvas.updateLines(sma_ratio.index, sma_ratio.to_numpy()):
+            return
 
         title = "Zonnepanelen"
 
@@ -320,21 +460,13 @@ class MainWindow_EXEC():
         canvas.axes.xaxis_date()
         canvas.axes.set_xlabel("Datum")
         canvas.axes.set_ylabel("SMA 7000 / SMA 3000")
-        canvas.axes.plot(sma_ratio, ".")
+        canvas.plotLines(sma_ratio.index, sma_ratio.to_numpy(), '.')
         canvas.axes.grid(True)
 
         plt.margins(0.05, 0.1)
 
         canvas.draw()
 
-        # Bereken de totale opbrengst per dag van de zonnepanelen
-
-        z_total = self.df.SMA_3000.shift(1) + self.df.SMA_7000.shift(1)
-        z_total = z_total.dropna()
-
-        print ("Totale opbrengst zonnepanelen [kWh]")
-        print (z_total.tail(20))
-
 
 
 
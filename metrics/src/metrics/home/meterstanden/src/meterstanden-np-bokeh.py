@@ -11,7 +11,9 @@ import os
 from bokeh.plotting import figure, show
 from bokeh.io import output_notebook, output_file, save
 from bokeh.models import HoverTool, ColumnDataSource, LabelSet
-from datetime import datetime
+
+from data import load_readings
+from derived import derived_series
 
 output_notebook()
 
@@ -37,15 +39,12 @@ show_browser = "safari"
 
 
 
-# Load the data from the csv file 
-
-data = np.recfromcsv(filename)
-
-
+# Load the data from the csv file, the same readings and derived series as the Meterstanden GUI
 
-# Convert the byte string b'' into a 'normal' string
+readings = load_readings(filename)
+series = derived_series(readings)
 
-dt = [datetime.strptime(x.decode('UTF-8'), '%Y-%m-%d %H:%M') for x in data['date_time']]
+data, dt = readings.data, readings.dt
 
 
 
@@ -82,28 +81,9 @@ show(p, browser=show_browser)
 
 # Maak een plot voor het gasverbruik per dag
 
-# Bereken het verbruik in gas tussen twee opeenvolgende metingen
-
-g1 = data['gas'][0:-1]
-g2 = data['gas'][1:]
-g_diff = np.array(g2-g1)
-
-# Bereken de tijd tussen twee opeenvolgende metingen in dagen
-
-d1 = dt[0:-1]
-d2 = dt[1:]
-
-helper = np.vectorize(lambda x: x.total_seconds())
-dt_sec = helper(np.array(d2)-np.array(d1))
-dt_days = dt_sec / 60. / 60. / 24.
-
-
-
-
-
-# Bereken het verbruik van gas per dag
+# Het verbruik van gas per dag tussen twee opeenvolgende metingen
 
-gpd = g_diff / dt_days
+gpd = series.gas_per_day
 
 
 from bokeh.models import LinearAxis, Range1d
@@ -112,8 +92,8 @@ p = figure(x_axis_label='Datum', x_axis_type='datetime', y_axis_label='Verbruik
            plot_height=plot_height, plot_width=plot_width, title='Verbruik Gas per dag')
 
 p.y_range = Range1d(-20,20)
-p.line(dt[1:], gpd, line_width=1)
-p.circle(dt[1:], gpd, fill_color='white', size=4)
+p.line(gpd.index, gpd.to_numpy(), line_width=1)
+p.circle(gpd.index, gpd.to_numpy(), fill_color='white', size=4)
 
 p.extra_y_ranges = {"temp": Range1d(start=-10, end=60)}
 p.add_layout(LinearAxis(y_range_name="temp"), 'right')
@@ -148,32 +128,18 @@ show(p, browser=show_browser)
 
 # Verbruik elektriciteit per dag
 
-# Bereken het verbruik in elektriciteit tussen twee opeenvolgende metingen
-# Elektriciteit voor de dag en nacht teller eerst bijeen tellen
+# Het totaal verbruik per dag is de som van het elektriciteitsverbruik (dag en nacht teller)
+# en de opbrengst van de zonnepanelen
 
-e_total = data['edag'] + data['enacht']
-e1 = e_total[0:-1]
-e2 = e_total[1:]
-e_diff = np.array(e2-e1)
-
-
-
-
-
-# Bereken de totale opbrengst per dag van de zonnepanelen
-
-z_total = data['sma_3000'] + data['sma_7000']
-
-epd = e_diff + z_total[:-1] / dt_days
-#epd = e_diff /dt_days + z_total[1:]
+epd = series.consumption_per_day
 
 
 
 p = figure(x_axis_label='Datum', x_axis_type='datetime', y_axis_label='Verbruik (kWh/dag)', \
 		   plot_height=plot_height, plot_width=plot_width, title='Verbruik Elektriciteit per dag')
 
-p.line(dt[1:], epd, line_width=1)
-p.circle(dt[1:], epd, fill_color='white', size=4)
+p.line(epd.index, epd.to_numpy(), line_width=1)
+p.circle(epd.index, epd.to_numpy(), fill_color='white', size=4)
 
 output_file(os.path.join(outputdir, "Verbruik_Elektriciteit_per_dag.html"))
 save(p)
@@ -182,9 +148,11 @@ show(p, browser=show_browser)
 
 # Verschil tussen het berekende z_totaal en data['sma']
 
-data_sma = data['sma']
-where_isnan = np.isnan(data_sma)
-data_sma[where_isnan] = 0.0
+z_total = data['sma_3000'] + data['sma_7000']
+
+# De readings worden gedeeld, dus niet in-place aanpassen
+
+data_sma = np.nan_to_num(data['sma'])
 
 sma_diff = z_total - data_sma
 
@@ -225,12 +193,12 @@ show(p, browser=show_browser)
 
 # Verhouding opbrengst zonnepanelen
 
-sma_ratio = data['sma_7000'] / data['sma_3000']
+sma_ratio = series.sma_ratio
 
 p = figure(x_axis_label='Datum', x_axis_type='datetime', y_axis_label='SMA 7000 / SMA 3000', \
            plot_height=plot_height, plot_width=plot_width, title='Verhouding SMA 7000 vs SMA 3000')
 
-p.circle(dt, sma_ratio)
+p.circle(sma_ratio.index, sma_ratio.to_numpy())
 
 output_file(os.path.join(outputdir, "Ratio_Zonnepanelen.html"))
 save(p)
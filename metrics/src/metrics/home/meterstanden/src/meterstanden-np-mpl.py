@@ -5,7 +5,8 @@ import requests
 import urllib.request, urllib.parse, urllib.error
 import sys, os, logging
 
-import datetime
+from data import load_readings
+from derived import derived_series
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(message)s")
 
@@ -55,15 +56,14 @@ if ON_IPAD:
 # n = copy_file_from_dropbox(dropbox_location, input_filename)
 # print("{} copied from dropbox, {} bytes copied, destination is {}".format(dropbox_location, n, input_filename))
 
-# Read the input csv file
-
-data = np.recfromcsv(os.path.join(HOME_DIR, input_filename))
+# Read the input csv file, the same readings and derived series as the Meterstanden GUI
 
 logging.info("Reading input csv file from {}.".format(input_filename))
 
-# Convert the byte string b'' into a 'normal' string
+readings = load_readings(os.path.join(HOME_DIR, input_filename))
+series = derived_series(readings)
 
-dt = np.array([datetime.datetime.strptime(x.decode('UTF-8'), '%Y-%m-%d %H:%M') for x in data['date_time']])
+data, dt = readings.data, readings.dt
 
 years = mdates.YearLocator()   # every year
 months = mdates.MonthLocator()  # every month
@@ -145,24 +145,9 @@ plt.close()
 
 # ------ gasverbruik per dag ---------------------------------------------------
 
-# Bereken het verbruik in gas tussen twee opeenvolgende metingen
-
-g1 = data['gas'][0:-1]
-g2 = data['gas'][1:]
-g_diff = np.array(g2-g1)
-
-# Bereken de tijd tussen twee opeenvolgende metingen in dagen
-
-d1 = dt[0:-1]
-d2 = dt[1:]
+# Het verbruik van gas per dag tussen twee opeenvolgende metingen
 
-helper = np.vectorize(lambda x: x.total_seconds())
-dt_sec = helper(np.array(d2)-np.array(d1))
-dt_days = dt_sec / 60. / 60. / 24.
-
-# Bereken het verbruik van gas per dag
-
-gpd = g_diff / dt_days
+gpd = series.gas_per_day
 
 fig, ax = plt.subplots()
 
@@ -172,8 +157,8 @@ ax.xaxis_date()
 ax.set_xlabel("Datum")
 ax.set_ylabel("Verbruik Gas [m$^3$/dag]")
 
-ax.plot(dt[1:], gpd, 'k-', linewidth=2.0, color='blue')
-ax.plot(dt[1:], gpd, 'wo')
+ax.plot(gpd.index, gpd.to_numpy(), 'k-', linewidth=2.0, color='blue')
+ax.plot(gpd.index, gpd.to_numpy(), 'wo')
 
 plt.margins(0.05, 0.1)
 plt.show()
@@ -205,26 +190,17 @@ plt.close()
 
 # ------ elektriciteit per dag -------------------------------------------------
 
-# Bereken het verbruik in elektriciteit tussen twee opeenvolgende metingen
-# Elektriciteit voor de dag en nacht teller eerst bijeen tellen
-
-e_total = data['edag'] + data['enacht']
-e1 = e_total[0:-1]
-e2 = e_total[1:]
-e_diff = np.array(e2-e1)
-
-# Bereken de totale opbrengst per dag van de zonnepanelen
-
-z_total = data['sma_3000'] + data['sma_7000']
+# Het totaal verbruik per dag is de som van het elektriciteitsverbruik (dag en nacht teller)
+# en de opbrengst van de zonnepanelen
 
-epd = e_diff + z_total[:-1] / dt_days
+epd = series.consumption_per_day
 
 
 fig,ax = plt.subplots()
 fig.autofmt_xdate()
 ax.xaxis_date()
-ax.plot(dt[1:], epd, linewidth=1)
-ax.plot(dt[1:], epd, 'wo')
+ax.plot(epd.index, epd.to_numpy(), linewidth=1)
+ax.plot(epd.index, epd.to_numpy(), 'wo')
 
 plt.margins(0.05, 0.1)
 plt.show()
@@ -235,9 +211,11 @@ plt.close()
 
 # Bereken het verschil tussen het berekende z_totaal en data['sma']
 
-data_sma = data['sma']
-where_isnan = np.isnan(data_sma)
-data_sma[where_isnan] = 0.0
+z_total = data['sma_3000'] + data['sma_7000']
+
+# De readings worden gedeeld, dus niet in-place aanpassen
+
+data_sma = np.nan_to_num(data['sma'])
 
 sma_diff = z_total - data_sma
 
@@ -257,13 +235,12 @@ plt.margins(0.05, 0.1)
 plt.show()
 plt.close()
 
-# FIXME: Dit klopt nog niet helemaal, z_total is blijkbaar niet volledig ingevuld...
 print ("Totale opbrengst zonnepanelen [kWh]")
-print (z_total[-10:])
+print (series.solar_total.tail(10))
 
 # ------ verhouding opbrengst zonnepanelen -------------------------------------
 
-sma_ratio = data['sma_7000'] / data['sma_3000']
+sma_ratio = series.sma_ratio
 
 fig,ax = plt.subplots()
 
@@ -272,7 +249,7 @@ ax.xaxis_date()
 
 ax.set_xlabel("Datum")
 ax.set_ylabel("SMA 7000 / SMA 3000")
-ax.plot(dt, sma_ratio, "b.")
+ax.plot(sma_ratio.index, sma_ratio.to_numpy(), "b.")
 
 plt.margins(0.05, 0.1)
 plt.show()
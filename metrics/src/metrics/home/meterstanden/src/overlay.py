@@ -0,0 +1,107 @@
+import numpy as np
+
+NS_PER_DAY = 24 * 60 * 60 * 1_000_000_000
+
+# The day of the year where the meters are set to zero, i.e. the 3rd of January
+
+REFERENCE_DAY = 3
+
+
+class YearOverlay:
+    """
+    The meter readings of each year, aligned on the day of the year.
+
+        years    : the years in the readings, in increasing order
+        doy      : the fractional day of the year of each reading, 1.0 is January 1st at midnight
+        values   : per meter, the reading minus the baseline of its year
+        offsets  : per meter, the baseline of each year
+
+    The baseline of a year is the meter value interpolated at the reference day of that year.
+    When the readings start after the reference day, the first reading of the year is used.
+    """
+
+    def __init__(self, years, bounds, doy, values, offsets):
+        self.years = years
+        self.bounds = bounds
+        self.doy = doy
+        self.values = values
+        self.offsets = offsets
+
+    def __iter__(self):
+        for year in self.years:
+            yield (year, *self.year(year))
+
+    def year(self, year):
+        """Returns the day of the year and the values per meter for the given year."""
+        idx = np.searchsorted(self.years, year)
+        if idx == len(self.years) or self.years[idx] != year:
+            raise KeyError(f"There are no readings for {year}.")
+
+        start, stop = self.bounds[idx], self.bounds[idx + 1]
+
+        return self.doy[start:stop], {meter: values[start:stop] for meter, values in self.values.items()}
+
+
+def year_overlay(readings, meters, years=None, reference_day=REFERENCE_DAY):
+    """
+    Returns the YearOverlay of the given meters, e.g. ['Gas', 'eDag', 'Water'].
+
+    The readings are split into years once, using the sorted timestamps. When years is given,
+    only those years are kept.
+    """
+    dt = readings.dt
+    order = None
+
+    if len(dt) and not np.all(dt[1:] >= dt[:-1]):
+        order = np.argsort(dt, kind='stable')
+        dt = dt[order]
+
+    year_start = dt.astype('datetime64[Y]')
+    row_years = year_start.astype(np.int64) + 1970
+
+    all_years, bounds = np.unique(row_years, return_index=True)
+    bounds = np.append(bounds, len(dt))
+
+    ns = dt.astype('datetime64[ns]').view(np.int64)
+    doy = (ns - year_start.astype('datetime64[ns]').view(np.int64)) / NS_PER_DAY + 1.0
+
+    # The reference time of each year, as nanoseconds
+
+    reference = (all_years - 1970).astype('datetime64[Y]').astype('datetime64[ns]').view(np.int64)
+    reference += (reference_day - 1) * NS_PER_DAY
+
+    counts = np.diff(bounds)
+
+    values = {}
+    offsets = {}
+
+    for meter in meters:
+        column = readings.df[meter].to_numpy()
+        if order is not None:
+            column = column[order]
+
+        valid = ~np.isnan(column)
+
+        # Interpolate the baseline for all years at once, no extrapolation outside the readings
+
+        offset = np.interp(reference, ns[valid], column[valid], left=np.nan, right=np.nan)
+
+        # Fall back to the first valid reading of the year
+
+        first = np.minimum.reduceat(np.where(valid, np.arange(len(column)), len(column)), bounds[:-1])
+        missing = np.isnan(offset) & (first < bounds[1:])
+        offset[missing] = column[first[missing]]
+
+        offsets[meter] = offset
+        values[meter] = column - np.repeat(offset, counts)
+
+    if years is not None:
+        keep = np.isin(all_years, list(years))
+        rows = np.repeat(keep, counts)
+        all_years = all_years[keep]
+        bounds = np.append(0, np.cumsum(counts[keep]))
+        doy = doy[rows]
+        values = {meter: value[rows] for meter, value in values.items()}
+        offsets = {meter: offset[keep] for meter, offset in offsets.items()}
+
+    return YearOverlay(all_years, bounds, doy, values, offsets)
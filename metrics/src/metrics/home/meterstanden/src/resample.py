@@ -0,0 +1,131 @@
+import logme
+import numpy as np
+import pandas as pd
+
+# The cumulative counters in the csv file. The SMA columns are the yield of a single day and
+# the temperature is a sample, these can not be interpolated as a counter.
+
+COUNTERS = ['Gas', 'eDag', 'eNacht', 'Water']
+YIELDS = ['SMA_3000', 'SMA_7000']
+
+FREQUENCIES = {
+    'D': np.timedelta64(1, 'D'),
+    'h': np.timedelta64(1, 'h'),
+}
+
+_CACHE = {}
+
+
+class Grid:
+    """
+    The cumulative counters interpolated onto a regular time grid.
+
+        time    : the grid as datetime64, at midnight for a daily grid, at the full hour for an hourly grid
+        values  : a 2D array with one column per counter, the counter value at each grid time
+
+    A cell is NaN when the grid time is before the first or after the last reading of that
+    counter, no values are extrapolated.
+    """
+
+    def __init__(self, time, values, counters, step):
+        self.time = time
+        self.values = values
+        self.counters = list(counters)
+        self.step = step
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, counter):
+        return self.values[:, self.counters.index(counter)]
+
+    @property
+    def df(self):
+        index = pd.DatetimeIndex(self.time, name='Date_Time')
+        return pd.DataFrame(self.values, index=index, columns=self.counters, copy=False)
+
+    def usage(self, counter):
+        """Returns the usage of the counter during each grid step, labelled with the start of the step."""
+        return np.diff(self[counter])
+
+    def per_day(self, counter):
+        """Returns the usage of the counter per day during each grid step, as a Series."""
+        usage = self.usage(counter) / (self.step / np.timedelta64(1, 'D'))
+        return pd.Series(usage, index=pd.DatetimeIndex(self.time[:-1], name='Date_Time'), name=counter)
+
+
+def interpolate(readings, time, counters):
+    """Returns the counters interpolated at the given times, the missing cells are skipped per counter."""
+    dt = readings.dt
+    order = None
+
+    if len(dt) and not np.all(dt[1:] >= dt[:-1]):
+        order = np.argsort(dt, kind='stable')
+        dt = dt[order]
+
+    ns = dt.view(np.int64)
+    x = time.astype('datetime64[ns]').view(np.int64)
+
+    values = np.empty((len(time), len(counters)), dtype=np.float64)
+
+    for idx, counter in enumerate(counters):
+        column = readings.df[counter].to_numpy()
+        if order is not None:
+            column = column[order]
+
+        valid = ~np.isnan(column)
+        if not valid.any():
+            values[:, idx] = np.nan
+            continue
+
+        values[:, idx] = np.interp(x, ns[valid], column[valid], left=np.nan, right=np.nan)
+
+    return values
+
+
+def daily_total(readings, columns=YIELDS):
+    """
+    Returns the sum of the columns for the day of each reading, as a Series labelled with
+    midnight of that day, e.g. the total yield of the solar panels per day. Readings with an
+    empty cell are left out.
+    """
+    total = readings.df[columns].sum(axis=1, min_count=len(columns)).dropna()
+
+    return total.groupby(total.index.normalize()).sum()
+
+
+@logme.log
+def resample(readings, freq='D', counters=COUNTERS, logger=None):
+    """
+    Returns the Grid with the counters interpolated onto a daily ('D') or hourly ('h') grid.
+
+    The grid is kept in memory for the readings, it is only calculated again when the
+    readings are loaded again.
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency '{freq}', use one of {', '.join(FREQUENCIES)}.")
+
+    counters = tuple(counters)
+    key = (readings.filename, freq, counters)
+
+    cached = _CACHE.get(key)
+    if cached and cached[0] is readings:
+        return cached[1]
+
+    step = FREQUENCIES[freq]
+    unit = np.dtype(f'datetime64[{np.datetime_data(step.dtype)[0]}]')
+
+    if len(readings):
+        start = readings.dt.min().astype(unit)
+        stop = readings.dt.max().astype(unit)
+        time = np.arange(start, stop + step, step)
+    else:
+        time = np.empty(0, dtype=unit)
+
+    grid = Grid(time, interpolate(readings, time, counters), counters, step)
+
+    logger.debug("Resampled {} readings onto {} grid points.".format(len(readings), len(grid)))
+
+    _CACHE[key] = (readings, grid)
+
+    return grid
@@ -0,0 +1,34 @@
+from PyQt5 import QtCore
+
+
+class WorkerSignals(QtCore.QObject):
+    """The signals of a Worker, a QRunnable is not a QObject and can't define signals itself."""
+
+    finished = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(object)
+
+
+class Worker(QtCore.QRunnable):
+    """
+    Runs a function in a thread of the QThreadPool.
+
+    The result of the function is emitted with the finished signal, an exception with the
+    error signal. The signals are delivered in the GUI thread, so the connected functions
+    can safely update the widgets.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as exc:
+            self.signals.error.emit(exc)
+        else:
+            self.signals.finished.emit(result)